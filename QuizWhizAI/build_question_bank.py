@@ -0,0 +1,278 @@
+"""Offline question-bank builder.
+
+Generates a target number of questions per chapter with concurrent workers,
+drops exact and near duplicates of the existing bank, checkpoints accepted
+questions so an interrupted run resumes, and writes a new snapshot plus a
+throughput report.
+
+    python build_question_bank.py --per-topic 50 --workers 4 --rpm 60
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+import metrics
+from create_context_from_PDF import PDF_FOLDER, load_topic_contexts
+from firebase_snapshot import SnapshotWriter, iter_snapshot_records
+from get_quiz import get_quiz_from_topic, get_quizzes_from_topic
+from near_duplicates import NEAR_DUP_THRESHOLD, NearDuplicateIndex
+from openai_client import get_usage_totals
+from question_hash import question_hash
+
+# A topic whose requests add nothing but duplicates this many times in a row
+# is treated as exhausted and no longer claimed
+MAX_UNPRODUCTIVE_REQUESTS = 5
+
+
+class RateLimiter:
+    """Token bucket shared by all workers that backs off when requests fail.
+
+    The rate is halved after a failed request (usually a rate limit that
+    outlasted the client's retries) and creeps back up by one request per
+    minute after each success, never exceeding the configured ``rpm``.
+    """
+
+    def __init__(self, rpm: float):
+        self.max_rpm = rpm
+        self.rpm = rpm
+        self._tokens = 1.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(1.0, self._tokens + (now - self._last) * self.rpm / 60)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) * 60 / self.rpm
+            time.sleep(wait)
+
+    def penalize(self) -> None:
+        with self._lock:
+            self.rpm = max(1.0, self.rpm / 2)
+
+    def reward(self) -> None:
+        with self._lock:
+            self.rpm = min(self.max_rpm, self.rpm + 1)
+
+
+class QuestionBankBuilder:
+    def __init__(self, topics: List[str], per_topic: int, api_key: str, existing: Optional[str],
+                 checkpoint: str, batch_size: int, limiter: RateLimiter,
+                 checkpoint_every: float = 10.0):
+        self.topics = topics
+        self.per_topic = per_topic
+        self.api_key = api_key
+        self.existing = existing
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.limiter = limiter
+        self.checkpoint_every = checkpoint_every
+        self.topic_contexts = load_topic_contexts(topics)
+
+        self.hashes = set()
+        self.near_duplicates = NearDuplicateIndex(NEAR_DUP_THRESHOLD) if NEAR_DUP_THRESHOLD > 0 else None
+        self.accepted: Counter = Counter()
+        self.claimed: Counter = Counter()
+        self.unproductive: Counter = Counter()
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._pending: List[Dict] = []
+        self._last_flush = time.monotonic()
+
+    def _index(self, question: Dict) -> None:
+        content_hash = question_hash(question)
+        self.hashes.add(content_hash)
+        if self.near_duplicates is not None:
+            self.near_duplicates.add(content_hash, question)
+
+    def load_existing(self) -> int:
+        """Indexes the existing bank and any checkpointed questions from a previous run."""
+        count = 0
+        if self.existing and os.path.exists(self.existing):
+            for question in iter_snapshot_records(self.existing):
+                self._index(question)
+                count += 1
+        if os.path.exists(self.checkpoint):
+            for question in iter_snapshot_records(self.checkpoint):
+                self._index(question)
+                self.accepted[question.get("topic")] += 1
+        return count
+
+    def _is_duplicate(self, question: Dict) -> bool:
+        if question_hash(question) in self.hashes:
+            return True
+        return self.near_duplicates is not None and self.near_duplicates.is_near_duplicate(question)
+
+    def _claim(self) -> Optional[tuple]:
+        """Reserves up to batch_size questions for the topic furthest from its target."""
+        with self._lock:
+            open_topics = [t for t in self.topics if self.accepted[t] + self.claimed[t] < self.per_topic
+                           and self.unproductive[t] < MAX_UNPRODUCTIVE_REQUESTS]
+            if not open_topics:
+                return None
+            topic = min(open_topics, key=lambda t: self.accepted[t] + self.claimed[t])
+            n = min(self.batch_size, self.per_topic - self.accepted[topic] - self.claimed[topic])
+            self.claimed[topic] += n
+            return topic, n
+
+    def _generate(self, topic: str, n: int) -> List[Dict]:
+        chunks = self.topic_contexts.get(topic, [])
+        if n == 1:
+            question = get_quiz_from_topic(topic, self.api_key, chunks, session_id="bank-builder")
+            return [question] if question else []
+        return get_quizzes_from_topic(topic, self.api_key, chunks, n, session_id="bank-builder")
+
+    def _accept(self, topic: str, requested: int, questions: List[Dict]) -> int:
+        """Checkpoints the new questions of one response; returns how many were accepted."""
+        added = 0
+        with self._lock:
+            self.claimed[topic] -= requested
+            self.stats["requests"] += 1
+            self.stats["requested"] += requested
+            self.stats["generated"] += len(questions)
+            if not questions:
+                self.stats["failed_requests"] += 1
+            for question in questions:
+                if self.accepted[topic] >= self.per_topic:
+                    break
+                if self._is_duplicate(question):
+                    self.stats["duplicates"] += 1
+                    continue
+                self._index(question)
+                self.accepted[topic] += 1
+                added += 1
+                self._pending.append({**question, "topic": topic, "content_hash": question_hash(question)})
+            if added:
+                self.unproductive[topic] = 0
+            elif questions:
+                self.stats["unproductive_requests"] += 1
+                self.unproductive[topic] += 1
+                if self.unproductive[topic] == MAX_UNPRODUCTIVE_REQUESTS:
+                    print(f"⚠️ Stopping {topic} at {self.accepted[topic]} questions: "
+                          f"{MAX_UNPRODUCTIVE_REQUESTS} requests in a row added only duplicates.")
+            if time.monotonic() - self._last_flush >= self.checkpoint_every:
+                self._flush()
+        return added
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        with open(self.checkpoint, "a", encoding="utf-8") as f:
+            for question in self._pending:
+                f.write(json.dumps(question, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending.clear()
+        self._last_flush = time.monotonic()
+
+    def _worker(self) -> None:
+        failures_in_a_row = 0
+        while True:
+            claim = self._claim()
+            if claim is None:
+                return
+            topic, n = claim
+            self.limiter.acquire()
+            try:
+                questions = self._generate(topic, n)
+            except Exception as e:
+                print(f"❌ Generation failed for {topic}: {e}")
+                questions = []
+            self._accept(topic, n, questions)
+
+            if questions:
+                failures_in_a_row = 0
+                self.limiter.reward()
+            else:
+                failures_in_a_row += 1
+                self.limiter.penalize()
+                if failures_in_a_row >= 5:
+                    print("❌ Worker giving up after 5 failed requests in a row.")
+                    return
+
+    def run(self, workers: int) -> None:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in range(workers):
+                pool.submit(self._worker)
+        with self._lock:
+            self._flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a question bank offline.")
+    parser.add_argument("--per-topic", type=int, required=True, help="Target new questions per chapter")
+    parser.add_argument("--topics", nargs="*", help="Chapters to build (default: every PDF in gaddis_files)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=60, help="Maximum requests per minute")
+    parser.add_argument("--batch-size", type=int, default=5, help="Questions requested per completion")
+    parser.add_argument("--existing", default="questions_snapshot.json", help="Bank to deduplicate against")
+    parser.add_argument("--output", default="questions_snapshot.new.json")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint.jsonl)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    metrics.start_exporters()
+    api_key = os.getenv("OPENAI_API_KEY")
+    topics = args.topics or sorted(
+        os.path.splitext(name)[0] for name in os.listdir(PDF_FOLDER) if name.endswith(".pdf")
+    )
+    checkpoint = args.checkpoint or f"{args.output}.checkpoint.jsonl"
+
+    builder = QuestionBankBuilder(topics, args.per_topic, api_key, args.existing, checkpoint,
+                                  max(1, args.batch_size), RateLimiter(args.rpm))
+    existing_count = builder.load_existing()
+    resumed = sum(builder.accepted.values())
+    print(f"Indexed {existing_count} existing questions; resuming with {resumed} checkpointed.")
+
+    usage_before = get_usage_totals()
+    started = time.monotonic()
+    builder.run(args.workers)
+    elapsed = time.monotonic() - started
+    usage_after = get_usage_totals()
+
+    writer = SnapshotWriter(args.output)
+    if args.existing and os.path.exists(args.existing):
+        for question in iter_snapshot_records(args.existing):
+            writer.write(question)
+    if os.path.exists(checkpoint):
+        for question in iter_snapshot_records(checkpoint):
+            writer.write(question)
+    writer.close()
+
+    new_questions = sum(builder.accepted.values()) - resumed
+    requests = builder.stats["requests"]
+    report = {
+        "elapsed_seconds": round(elapsed, 1),
+        "new_questions": new_questions,
+        "questions_per_minute": round(new_questions / elapsed * 60, 2) if elapsed else 0.0,
+        "requests": requests,
+        "failure_rate": round(builder.stats["failed_requests"] / requests, 3) if requests else 0.0,
+        "duplicates_dropped": builder.stats["duplicates"],
+        "unproductive_requests": builder.stats["unproductive_requests"],
+        "undelivered": builder.stats["requested"] - builder.stats["generated"],
+        "prompt_tokens": usage_after["prompt_tokens"] - usage_before["prompt_tokens"],
+        "completion_tokens": usage_after["completion_tokens"] - usage_before["completion_tokens"],
+        "per_topic": dict(builder.accepted),
+        "snapshot_questions": writer.count,
+    }
+    with open(f"{args.output}.report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    print(f"Wrote {writer.count} questions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,462 @@
+import hashlib
+import mmap
 import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import fitz  # PyMuPDF
 
+import metrics
+
 PDF_FOLDER = "gaddis_files"
-CHUNK_SIZE = 1000
-OVERLAP = 200
+# Token budget per chunk (~4 characters per token) and the context carried over
+CHUNK_TOKENS = 250
+CHUNK_OVERLAP_TOKENS = 50
+
+# On-disk chunk cache; one file per (PDF content, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+CACHE_DIR = os.getenv(
+    "CONTEXT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".context_cache")
+)
+
+# Memory budget for chunks kept in the process-wide topic store
+CONTEXT_MEMORY_BUDGET_MB = int(os.getenv("CONTEXT_MEMORY_BUDGET_MB", "64"))
+
+# Cache file layout: magic | uint32 count | uint32 pages[count] | uint64 text offsets[count + 1]
+# | uint64 section offsets[count + 1] | utf-8 text blob | utf-8 section blob
+_CACHE_MAGIC = b"QWCHNK02"
+_COUNT = struct.Struct("<I")
+
+# (mtime_ns, size) per PDF path → content hash, so warm reruns only stat the file
+_HASH_MEMO: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+_BULLET_RE = re.compile(r"^\s*[•\-*–▪◦]\s*")
+_NUMBERED_HEADING_RE = re.compile(r"^(chapter\s+\d+|\d+(\.\d+)+)\s+\S", re.IGNORECASE)
+_CONTINUED_RE = re.compile(r"\s*\(cont[’']?d\.?\)\s*$", re.IGNORECASE)
+_CODE_LINE_RE = re.compile(
+    r"^\s*(\d+\s+)?(def |class |import |from \w+ import|for |while |if |elif |else:|try:|except|return\b"
+    r"|print\(|#|>>>|[A-Za-z_][\w.]*\s*[-+*/]?=[^=]|[A-Za-z_][\w.]*\(.*\)\s*$)"
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+class TextChunk(NamedTuple):
+    text: str
+    page: int      # 1-based page the chunk starts on
+    section: str   # heading the chunk falls under ("" before the first heading)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for chunking and prompt budgeting."""
+    return (len(text) + 3) // 4
+
+
+def _is_code(lines: List[str]) -> bool:
+    return len(lines) > 1 and sum(bool(_CODE_LINE_RE.match(line)) for line in lines) * 2 >= len(lines)
+
+
+def _clean_block(text: str, code: bool) -> str:
+    lines = [line.rstrip() for line in text.replace("\xa0", " ").splitlines() if line.strip()]
+    if code:
+        return "\n".join(lines)
+    # Re-join wrapped lines, keeping one line per bullet
+    merged: List[str] = []
+    for line in lines:
+        line = line.strip()
+        if merged and not _BULLET_RE.match(line):
+            merged[-1] = f"{merged[-1]} {line}"
+        else:
+            merged.append(line)
+    return "\n".join(" ".join(line.split()) for line in merged)
+
+
+def _looks_like_heading(text: str, top_of_page: bool) -> bool:
+    if len(text) > 80 or "\n" in text or _BULLET_RE.match(text) or text.endswith((".", ":", ";", ",")):
+        return False
+    return top_of_page or bool(_NUMBERED_HEADING_RE.match(text))
+
+
+def iter_pdf_blocks(pdf_path: str) -> Iterator[Tuple[int, str, str]]:
+    """Streams ``(page, kind, text)`` blocks page by page; kind is heading, code or text.
+
+    Short blocks inside the top or bottom page margin (running headers,
+    footers, page numbers) are dropped, and consecutive headings at the top
+    of a page are merged.
+    """
+    with fitz.open(pdf_path) as doc:
+        for page_number, page in enumerate(doc, start=1):
+            height = page.rect.height
+            top_of_page = True
+            heading = []
+            for x0, y0, x1, y1, raw, _, block_type in page.get_text("blocks", sort=True):
+                if block_type != 0:  # image block
+                    continue
+                lines = [line for line in raw.splitlines() if line.strip()]
+                if not lines:
+                    continue
+                code = _is_code(lines)
+                text = _clean_block(raw, code)
+                if len(text) <= 120 and (y1 <= height * 0.06 or y0 >= height * 0.9):
+                    continue
+
+                if not code and _looks_like_heading(text, top_of_page):
+                    heading.append(text)
+                    continue
+                if heading:
+                    yield page_number, "heading", " ".join(heading)
+                    heading = []
+                top_of_page = False
+                yield page_number, "code" if code else "text", text
+            if heading:
+                yield page_number, "heading", " ".join(heading)
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Streams ``(page, text)`` one page at a time."""
+    with fitz.open(pdf_path) as doc:
+        for page_number, page in enumerate(doc, start=1):
+            yield page_number, page.get_text()
 
 
 def extract_text_from_pdf(pdf_path):
     """Extracts full text from a PDF file."""
     try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        return text
+        return "".join(text for _, text in iter_pdf_pages(pdf_path))
     except Exception as e:
         print(f"❌ Failed to extract text from {pdf_path}: {e}")
         return ""
 
 
-def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=OVERLAP):
-    """Chunks text into overlapping segments for GPT context windows."""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        chunks.append(text[start:end].strip())
-        start += chunk_size - overlap
+def _split_block(text: str, kind: str, max_tokens: int) -> List[str]:
+    """Splits a block over the budget at line (code) or sentence (prose) boundaries."""
+    units = text.split("\n") if kind == "code" else _SENTENCE_END_RE.split(text)
+    pieces, current = [], ""
+    for unit in units:
+        while estimate_tokens(unit) > max_tokens:  # a single overlong line or sentence
+            head, unit = unit[:max_tokens * 4], unit[max_tokens * 4:]
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(head)
+        joined = f"{current}{chr(10) if kind == 'code' else ' '}{unit}" if current else unit
+        if estimate_tokens(joined) > max_tokens:
+            pieces.append(current)
+            current = unit
+        else:
+            current = joined
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def iter_chunks(blocks: Iterable[Tuple[int, str, str]], max_tokens: int = CHUNK_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[TextChunk]:
+    """Packs blocks into chunks of at most ``max_tokens`` without cutting paragraphs,
+    code listings or sentences.
+
+    A new section starts a new chunk (unless the current one is still under a
+    quarter of the budget), and the trailing blocks of a chunk that fit in
+    ``overlap_tokens`` are repeated at the start of the next one.
+    """
+    current: List[Tuple[int, str, int]] = []  # (page, text, tokens)
+    tokens = 0
+    section = chunk_section = ""
+
+    for page, kind, text in blocks:
+        if kind == "heading":
+            name = _CONTINUED_RE.sub("", text)
+            if name == section:
+                continue
+            section = name
+            if current and tokens >= max_tokens // 4:
+                yield TextChunk("\n\n".join(t for _, t, _ in current), current[0][0], chunk_section)
+                current, tokens = [], 0
+            if not current:
+                chunk_section = section
+            current.append((page, name, estimate_tokens(name)))
+            tokens += current[-1][2]
+            continue
+
+        pieces = [text] if estimate_tokens(text) <= max_tokens else _split_block(text, kind, max_tokens)
+        for piece in pieces:
+            cost = estimate_tokens(piece)
+            if current and tokens + cost > max_tokens:
+                yield TextChunk("\n\n".join(t for _, t, _ in current), current[0][0], chunk_section)
+                carry, carried = [], 0
+                for block in reversed(current):
+                    if carried + block[2] > overlap_tokens or carried + block[2] + cost > max_tokens:
+                        break
+                    carry.insert(0, block)
+                    carried += block[2]
+                current, tokens = carry, carried
+                chunk_section = section
+            if not current:
+                chunk_section = section
+            current.append((page, piece, cost))
+            tokens += cost
+
+    if current:
+        yield TextChunk("\n\n".join(t for _, t, _ in current), current[0][0], chunk_section)
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Yields chunks of plain text, split on blank lines, packed like PDF chunks."""
+    blocks = ((1, "text", block.strip()) for block in re.split(r"\n\s*\n", text) if block.strip())
+    for chunk in iter_chunks(blocks, max_tokens, overlap_tokens):
+        yield chunk.text
+
+
+def iter_pdf_chunks(pdf_path: str, max_tokens: int = CHUNK_TOKENS,
+                    overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[TextChunk]:
+    """Streams boundary-aligned chunks of a PDF with their page and section."""
+    return iter_chunks(iter_pdf_blocks(pdf_path), max_tokens, overlap_tokens)
+
+
+def pdf_content_hash(pdf_path: str) -> str:
+    """Returns the SHA-256 of a PDF, memoized on (mtime, size)."""
+    st = os.stat(pdf_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    memo = _HASH_MEMO.get(pdf_path)
+    if memo and memo[0] == stamp:
+        return memo[1]
+
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    _HASH_MEMO[pdf_path] = (stamp, digest.hexdigest())
+    return _HASH_MEMO[pdf_path][1]
+
+
+def _cache_path(pdf_hash: str, max_tokens: int, overlap_tokens: int) -> str:
+    return os.path.join(CACHE_DIR, f"{pdf_hash}-{max_tokens}t-{overlap_tokens}t.chunks")
+
+
+def _write_chunk_cache(path: str, chunks: Iterable[TextChunk]) -> int:
+    """Writes chunks as they are produced: texts go to a spool file, so only
+    offsets, pages and section names are held in memory. Returns the count."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pages: List[int] = []
+    text_offsets = [0]
+    sections: List[bytes] = []
+    with tempfile.TemporaryFile(dir=os.path.dirname(path)) as spool:
+        for chunk in chunks:
+            blob = chunk.text.encode("utf-8")
+            spool.write(blob)
+            text_offsets.append(text_offsets[-1] + len(blob))
+            pages.append(chunk.page)
+            sections.append(chunk.section.encode("utf-8"))
+
+        section_offsets = [0]
+        for blob in sections:
+            section_offsets.append(section_offsets[-1] + len(blob))
+
+        spool.seek(0)
+        with open(tmp_path, "wb") as f:
+            f.write(_CACHE_MAGIC)
+            f.write(_COUNT.pack(len(pages)))
+            f.write(struct.pack(f"<{len(pages)}I", *pages))
+            f.write(struct.pack(f"<{len(text_offsets)}Q", *text_offsets))
+            f.write(struct.pack(f"<{len(section_offsets)}Q", *section_offsets))
+            shutil.copyfileobj(spool, f)
+            f.write(b"".join(sections))
+    os.replace(tmp_path, path)
+    return len(pages)
+
+
+def _read_chunk_cache(path: str) -> Optional[List[TextChunk]]:
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < len(_CACHE_MAGIC) + _COUNT.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(_CACHE_MAGIC)] != _CACHE_MAGIC:
+                    return None
+                pos = len(_CACHE_MAGIC)
+                (count,) = _COUNT.unpack_from(mm, pos)
+                pos += _COUNT.size
+                pages = struct.unpack_from(f"<{count}I", mm, pos)
+                pos += 4 * count
+                text_offsets = struct.unpack_from(f"<{count + 1}Q", mm, pos)
+                pos += 8 * (count + 1)
+                section_offsets = struct.unpack_from(f"<{count + 1}Q", mm, pos)
+                text_base = pos + 8 * (count + 1)
+                section_base = text_base + text_offsets[-1]
+                return [
+                    TextChunk(
+                        mm[text_base + text_offsets[i]:text_base + text_offsets[i + 1]].decode("utf-8"),
+                        pages[i],
+                        mm[section_base + section_offsets[i]:section_base + section_offsets[i + 1]]
+                        .decode("utf-8"),
+                    )
+                    for i in range(count)
+                ]
+    except FileNotFoundError:
+        return None
+    except (OSError, struct.error, UnicodeDecodeError) as e:
+        print(f"⚠️ Ignoring unreadable chunk cache {path}: {e}")
+        return None
+
+
+def load_pdf_chunk_records(pdf_path: str, max_tokens=CHUNK_TOKENS,
+                           overlap_tokens=CHUNK_OVERLAP_TOKENS) -> List[TextChunk]:
+    """Returns the chunks of a PDF with page and section, extracting it only when the cache is cold."""
+    try:
+        cache_path = _cache_path(pdf_content_hash(pdf_path), max_tokens, overlap_tokens)
+    except OSError as e:
+        print(f"❌ Failed to read {pdf_path}: {e}")
+        return []
+
+    records = _read_chunk_cache(cache_path)
+    if records is not None:
+        metrics.incr("cache_hits", cache="chunk_file")
+        return records
+    metrics.incr("cache_misses", cache="chunk_file")
+
+    try:
+        with metrics.span("pdf_extract"):
+            _write_chunk_cache(cache_path, iter_pdf_chunks(pdf_path, max_tokens, overlap_tokens))
+        records = _read_chunk_cache(cache_path)
+        if records is not None:
+            return records
+    except OSError as e:
+        print(f"⚠️ Could not write chunk cache for {pdf_path}: {e}")
+    except Exception as e:
+        print(f"❌ Failed to extract text from {pdf_path}: {e}")
+        return []
+
+    try:
+        return list(iter_pdf_chunks(pdf_path, max_tokens, overlap_tokens))
+    except Exception as e:
+        print(f"❌ Failed to extract text from {pdf_path}: {e}")
+        return []
+
+
+def load_pdf_chunks(pdf_path: str, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Returns the chunk texts of a PDF."""
+    return [record.text for record in load_pdf_chunk_records(pdf_path, max_tokens, overlap_tokens)]
+
+
+def _load_topic_chunks(topic: str) -> List[str]:
+    filename = os.path.join(PDF_FOLDER, f"{topic}.pdf")
+    if not os.path.exists(filename):
+        print(f"❌ PDF not found for topic: {topic} → {filename}")
+        return []
+    chunks = load_pdf_chunks(filename)
+    if not chunks:
+        print(f"⚠️ No text found in PDF for topic: {topic}")
     return chunks
 
 
-def load_topic_contexts(topics):
-    """Loads and chunks text from PDFs for each topic."""
-    context_map = {}
-
-    for topic in topics:
-        filename = os.path.join(PDF_FOLDER, f"{topic}.pdf")
-        if os.path.exists(filename):
-            text = extract_text_from_pdf(filename)
-            if text:
-                context_map[topic] = chunk_text(text)
-            else:
-                print(f"⚠️ No text found in PDF for topic: {topic}")
-        else:
-            print(f"❌ PDF not found for topic: {topic} → {filename}")
+def _chunks_nbytes(chunks: Tuple[str, ...]) -> int:
+    return sys.getsizeof(chunks) + sum(sys.getsizeof(c) for c in chunks)
+
 
-    return context_map
+class TopicContextStore:
+    """Process-wide, thread-safe topic → chunks registry with an LRU memory budget.
+
+    Chapters are loaded on first access and shared as immutable tuples by every
+    session. When the retained chunks exceed ``max_bytes`` the least recently
+    used chapters are dropped; the chapter just requested is always kept.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[str, ...]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, topic: str) -> Tuple[str, ...]:
+        with self._lock:
+            chunks = self._entries.get(topic)
+            if chunks is not None:
+                self._entries.move_to_end(topic)
+                metrics.incr("cache_hits", cache="topic_context")
+                return chunks
+            load_lock = self._load_locks.setdefault(topic, threading.Lock())
+        metrics.incr("cache_misses", cache="topic_context")
+
+        # Only one thread extracts a given chapter; others wait for its result
+        with load_lock:
+            with self._lock:
+                chunks = self._entries.get(topic)
+                if chunks is not None:
+                    self._entries.move_to_end(topic)
+                    return chunks
+
+            chunks = tuple(_load_topic_chunks(topic))
+            if chunks:
+                self._insert(topic, chunks)
+            return chunks
+
+    def _insert(self, topic: str, chunks: Tuple[str, ...]) -> None:
+        size = _chunks_nbytes(chunks)
+        with self._lock:
+            self._entries[topic] = chunks
+            self._sizes[topic] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted, _ = self._entries.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(evicted)
+
+    def invalidate(self, topic: Optional[str] = None) -> None:
+        with self._lock:
+            if topic is None:
+                self._entries.clear()
+                self._sizes.clear()
+                self._total_bytes = 0
+            elif topic in self._entries:
+                del self._entries[topic]
+                self._total_bytes -= self._sizes.pop(topic)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "topics": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_STORE = TopicContextStore(CONTEXT_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+def get_topic_context_store() -> TopicContextStore:
+    return _STORE
+
+
+class TopicContexts(Mapping):
+    """Read-only topic → chunks view onto the shared TopicContextStore."""
+
+    def __init__(self, topics, store: Optional[TopicContextStore] = None):
+        self._topics = tuple(topics)
+        self._store = store or _STORE
+
+    def __getitem__(self, topic):
+        if topic not in self._topics:
+            raise KeyError(topic)
+        chunks = self._store.get(topic)
+        if not chunks:
+            raise KeyError(topic)
+        return chunks
+
+    def __iter__(self):
+        return iter(self._topics)
+
+    def __len__(self):
+        return len(self._topics)
+
+
+def load_topic_contexts(topics):
+    """Returns a lazy mapping of topic → text chunks backed by the shared store."""
+    return TopicContexts(topics)
@@ -1,5 +1,32 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
 from fpdf import FPDF, HTMLMixin
 
+import metrics
+
+# Rendered PDFs kept in memory, keyed on quiz content
+PDF_CACHE_SIZE = int(os.getenv("PDF_CACHE_SIZE", "64"))
+_pdf_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_pdf_cache_lock = threading.Lock()
+
+# The built-in Helvetica font only covers latin-1
+_LATIN1_SUBSTITUTES = str.maketrans({
+    "\u2014": "-", "\u2013": "-", "\u2018": "'", "\u2019": "'",
+    "\u201c": '"', "\u201d": '"', "\u2026": "...", "\u2022": "*", "\u2192": "->",
+})
+
+
+def _pdf_text(text) -> str:
+    text = str(text).translate(_LATIN1_SUBSTITUTES)
+    return text.encode("latin-1", "replace").decode("latin-1")
+
 
 class QuizPDF(FPDF, HTMLMixin):
     def __init__(self, quiz_title):
@@ -9,7 +36,7 @@ class QuizPDF(FPDF, HTMLMixin):
 
     def header(self):
         self.set_font("Helvetica", "B", 14)
-        self.cell(0, 10, self.quiz_title, ln=True, align="C")
+        self.cell(0, 10, _pdf_text(self.quiz_title), ln=True, align="C")
         self.ln(5)
 
     def footer(self):
@@ -18,7 +45,7 @@ class QuizPDF(FPDF, HTMLMixin):
         self.cell(0, 10, f"Page {self.page_no()}/{{nb}}", align="C")
 
 
-def generate_quiz_pdf(quiz_data, quiz_title="Python quiz and solutions", output_path="quiz.pdf"):
+def _render_quiz_pdf(quiz_data, quiz_title) -> bytes:
     pdf = QuizPDF(quiz_title)
     pdf.alias_nb_pages()
     pdf.add_page()
@@ -31,7 +58,7 @@ def generate_quiz_pdf(quiz_data, quiz_title="Python quiz and solutions", output_
     for idx, q in enumerate(quiz_data, start=1):
         pdf.set_font("Helvetica", "B", 12)
         pdf.set_x(pdf.l_margin)
-        pdf.multi_cell(avail, 8, f"{idx}. {q['question']}")
+        pdf.multi_cell(avail, 8, _pdf_text(f"{idx}. {q['question']}"))
 
         pdf.set_font("Helvetica", "", 11)
         if q.get("options"):
@@ -39,7 +66,7 @@ def generate_quiz_pdf(quiz_data, quiz_title="Python quiz and solutions", output_
                 option_width = avail - indent
                 if option_width > 0:
                     pdf.set_x(pdf.l_margin + indent)
-                    pdf.multi_cell(option_width, 6, f"- {opt}")
+                    pdf.multi_cell(option_width, 6, _pdf_text(f"- {opt}"))
         pdf.ln(3)
 
     # Answers and Explanations Section
@@ -51,11 +78,88 @@ def generate_quiz_pdf(quiz_data, quiz_title="Python quiz and solutions", output_
     for idx, q in enumerate(quiz_data, start=1):
         pdf.set_font("Helvetica", "B", 12)
         pdf.set_x(pdf.l_margin)
-        pdf.multi_cell(0, 7, f"{idx}. Correct Answer: {q['answer']}")
+        pdf.multi_cell(0, 7, _pdf_text(f"{idx}. Correct Answer: {q['answer']}"))
         pdf.set_font("Helvetica", "", 11)
         explanation = q.get("explanation", "No explanation provided.")
         pdf.set_x(pdf.l_margin)
-        pdf.multi_cell(0, 6, f"Explanation: {explanation}")
+        pdf.multi_cell(0, 6, _pdf_text(f"Explanation: {explanation}"))
         pdf.ln(3)
 
-    pdf.output(output_path)
+    out = pdf.output(dest="S")
+    # PyFPDF returns a latin-1 str, fpdf2 a bytearray
+    return out.encode("latin-1") if isinstance(out, str) else bytes(out)
+
+
+def _quiz_cache_key(quiz_data, quiz_title) -> str:
+    content = [quiz_title] + [
+        [q.get("question"), q.get("options"), q.get("answer"), q.get("explanation")]
+        for q in quiz_data
+    ]
+    payload = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def generate_quiz_pdf_bytes(quiz_data, quiz_title="Python quiz and solutions") -> bytes:
+    """Renders the quiz PDF in memory, reusing the result for identical quizzes."""
+    key = _quiz_cache_key(quiz_data, quiz_title)
+    with _pdf_cache_lock:
+        if key in _pdf_cache:
+            _pdf_cache.move_to_end(key)
+            metrics.incr("cache_hits", cache="pdf")
+            return _pdf_cache[key]
+    metrics.incr("cache_misses", cache="pdf")
+
+    with metrics.span("pdf_export"):
+        data = _render_quiz_pdf(quiz_data, quiz_title)
+    with _pdf_cache_lock:
+        _pdf_cache[key] = data
+        while len(_pdf_cache) > PDF_CACHE_SIZE:
+            _pdf_cache.popitem(last=False)
+    return data
+
+
+def generate_quiz_pdf(quiz_data, quiz_title="Python quiz and solutions", output_path="quiz.pdf"):
+    data = generate_quiz_pdf_bytes(quiz_data, quiz_title)
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+
+
+def _render_job(job):
+    title, quiz_data = job
+    return title, _render_quiz_pdf(quiz_data, title)
+
+
+def generate_quiz_pdfs(quizzes: Dict[str, List[dict]], max_workers=None) -> Dict[str, bytes]:
+    """Renders many quizzes (title → questions) in parallel worker processes."""
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return dict(pool.map(_render_job, quizzes.items()))
+
+
+def main():
+    from firebase_snapshot import SnapshotStore
+
+    parser = argparse.ArgumentParser(description="Render one quiz PDF per chapter from the snapshot.")
+    parser.add_argument("--snapshot", default="questions_snapshot.json")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per chapter quiz")
+    parser.add_argument("--output-dir", default="quiz_pdfs")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    store = SnapshotStore.load(args.snapshot)
+    quizzes = {
+        topic: store.sample(args.questions, topic=topic)
+        for topic in sorted(store.by_topic)
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for title, data in generate_quiz_pdfs(quizzes, args.workers).items():
+        path = os.path.join(args.output_dir, f"{title}.pdf")
+        with open(path, "wb") as f:
+            f.write(data)
+        print(f"Wrote {len(quizzes[title])} questions to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,198 @@
 # export_snapshot.py
+import argparse
+import datetime
 import json
+import os
 
 from firebase_admin import credentials, firestore, initialize_app
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firebase_snapshot import SnapshotWriter, iter_snapshot_records
+
+COLLECTION = "quiz_questions"
+PAGE_SIZE = 500
+# Allowance for the local clock running ahead of Firestore's commit timestamps
+CLOCK_SKEW = datetime.timedelta(seconds=60)
+
+
+def _jsonable(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _later(watermark, timestamp):
+    """Returns the later of two ISO-8601 timestamps (either may be None)."""
+    if not timestamp:
+        return watermark
+    if not watermark:
+        return timestamp
+    return max(watermark, timestamp, key=datetime.datetime.fromisoformat)
+
+
+def _export_started() -> str:
+    return (datetime.datetime.now(datetime.timezone.utc) - CLOCK_SKEW).isoformat()
+
+
+def _final_watermark(seen, started_at: str):
+    """The watermark to store after an export: never later than the export's start.
+
+    A document written while the export runs may land on a page that was
+    already read, with an updated_at below later documents' values; capping at
+    the start time makes the next incremental run pick it up.
+    """
+    if not seen:
+        return seen
+    return min(seen, started_at, key=datetime.datetime.fromisoformat)
+
+
+def _record(doc) -> dict:
+    data = doc.to_dict()
+    return _jsonable({**data, "id": doc.id}) if data else {}
+
+
+def _load_state(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(path: str, state: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _iter_pages(query, page_size: int, start_after=None):
+    """Yields lists of at most ``page_size`` documents, resuming after ``start_after``."""
+    while True:
+        page_query = query.limit(page_size)
+        if start_after is not None:
+            page_query = page_query.start_after(start_after)
+        docs = list(page_query.stream())
+        if not docs:
+            return
+        yield docs
+        if len(docs) < page_size:
+            return
+        start_after = docs[-1]
+
+
+def export_full(db, output: str, state_path: str, page_size: int = PAGE_SIZE) -> int:
+    """Streams the whole collection page by page in document-id order.
+
+    Fetched pages are spooled to ``<output>.pages.jsonl`` and the last document
+    id is checkpointed after every page, so an interrupted export resumes
+    where it stopped.
+    """
+    state = _load_state(state_path)
+    spool_path = f"{output}.pages.jsonl"
+    query = db.collection(COLLECTION).order_by("__name__")
+
+    cursor = state.get("cursor") if state.get("in_progress") else None
+    start_after = db.collection(COLLECTION).document(cursor).get() if cursor else None
+    if start_after is None or not start_after.exists:
+        start_after = None
+        state = {"in_progress": True, "watermark": None, "started_at": _export_started()}
+        open(spool_path, "w").close()
+
+    # Exports checkpointed before started_at was recorded restart their clock now
+    started_at = state.setdefault("started_at", _export_started())
+    watermark = state.get("watermark")
+    with open(spool_path, "a", encoding="utf-8") as spool:
+        for docs in _iter_pages(query, page_size, start_after):
+            for doc in docs:
+                record = _record(doc)
+                if record:
+                    spool.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    watermark = _later(watermark, record.get("updated_at"))
+            spool.flush()
+            os.fsync(spool.fileno())
+            state.update(cursor=docs[-1].id, watermark=watermark)
+            _save_state(state_path, state)
+
+    writer = SnapshotWriter(output)
+    for record in iter_snapshot_records(spool_path):
+        writer.write(record)
+    writer.close()
+    os.remove(spool_path)
+
+    _save_state(state_path, {"in_progress": False, "cursor": None,
+                             "watermark": _final_watermark(watermark, started_at)})
+    return writer.count
+
+
+def export_incremental(db, output: str, state_path: str, page_size: int = PAGE_SIZE) -> int:
+    """Fetches documents updated since the last watermark and merges them into ``output``.
+
+    Documents without updated_at (saved before it existed) are only picked up
+    by a full export; deletions are not propagated.
+    """
+    state = _load_state(state_path)
+    watermark = state.get("watermark")
+    if not watermark or state.get("in_progress") or not os.path.exists(output):
+        return export_full(db, output, state_path, page_size)
+
+    started_at = _export_started()
+    since = datetime.datetime.fromisoformat(watermark)
+    query = (db.collection(COLLECTION)
+             .where(filter=FieldFilter("updated_at", ">", since))
+             .order_by("updated_at"))
+
+    changed_path = f"{output}.changed.jsonl"
+    changed_ids = set()
+    with open(changed_path, "w", encoding="utf-8") as changed:
+        for docs in _iter_pages(query, page_size):
+            for doc in docs:
+                record = _record(doc)
+                if record:
+                    changed.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    changed_ids.add(record["id"])
+                    watermark = _later(watermark, record.get("updated_at"))
+
+    if changed_ids:
+        writer = SnapshotWriter(output)
+        for record in iter_snapshot_records(output):
+            if record.get("id") not in changed_ids:
+                writer.write(record)
+        for record in iter_snapshot_records(changed_path):
+            writer.write(record)
+        writer.close()
+    os.remove(changed_path)
+
+    _save_state(state_path, {"in_progress": False, "cursor": None,
+                             "watermark": _final_watermark(watermark, started_at)})
+    return len(changed_ids)
 
 
 def main():
-    cred = credentials.Certificate("firebase_credentials.json")
+    parser = argparse.ArgumentParser(description="Export Firestore quiz questions to a snapshot file.")
+    parser.add_argument("--output", default="questions_snapshot.json",
+                        help="Snapshot path; a .jsonl suffix writes JSON Lines instead of a JSON array")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch documents changed since the last export and merge them in")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--credentials", default="firebase_credentials.json")
+    args = parser.parse_args()
+
+    cred = credentials.Certificate(args.credentials)
     initialize_app(cred)
     db = firestore.client()
 
-    docs = db.collection("quiz_questions").stream()
-    questions = [d.to_dict() for d in docs if d.to_dict()]
-
-    with open("questions_snapshot.json", "w", encoding="utf-8") as f:
-        json.dump(questions, f, ensure_ascii=False, indent=2)
-
-    print(f"Wrote {len(questions)} questions to questions_snapshot.json")
+    state_path = f"{args.output}.state.json"
+    if args.incremental:
+        changed = export_incremental(db, args.output, state_path, args.page_size)
+        print(f"Merged {changed} changed questions into {args.output}")
+    else:
+        written = export_full(db, args.output, state_path, args.page_size)
+        print(f"Wrote {written} questions to {args.output}")
 
 
 if __name__ == "__main__":
@@ -1,17 +1,222 @@
+import argparse
+import atexit
+import json
 import logging
+import os
 import random
+import threading
+import time
+from typing import Iterable, List, Optional
 
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from near_duplicates import NEAR_DUP_THRESHOLD, NearDuplicateIndex
+from question_hash import question_hash
 
 logger = logging.getLogger(__name__)
 
+# Content hashes known to exist in Firestore; only positive results are cached
+_KNOWN_HASHES = set()
+_KNOWN_HASHES_LOCK = threading.Lock()
+
+# How long a server-side count is reused before Firestore is asked again
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "60"))
+_count_cache = {"value": None, "expires": 0.0}
+_count_lock = threading.Lock()
+
+# Near-duplicate index of the questions this process has saved
+_NEAR_DUPLICATES = NearDuplicateIndex(NEAR_DUP_THRESHOLD) if NEAR_DUP_THRESHOLD > 0 else None
+
+# Write-behind queue: saves are committed in batches of up to WRITE_BATCH_SIZE
+# (Firestore allows 500 per batch) or every WRITE_FLUSH_INTERVAL seconds
+WRITE_BATCH_SIZE = min(500, int(os.getenv("WRITE_BATCH_SIZE", "100")))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "2"))
+WRITE_SPOOL_PATH = os.getenv(
+    "WRITE_SPOOL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".firestore_spool.jsonl"),
+)
+# Failed commits of one batch before it is split; a single document that still
+# fails is moved to the dead-letter file (same format as the spool)
+WRITE_MAX_ATTEMPTS = int(os.getenv("WRITE_MAX_ATTEMPTS", "5"))
+WRITE_DEAD_LETTER_PATH = os.getenv(
+    "WRITE_DEAD_LETTER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".firestore_dead_letters.jsonl"),
+)
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def _get_db():
+    """The Firestore client, created once and shared by every call."""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = firestore.client()
+    return _db
+
+
+class WriteBehindQueue:
+    """Coalesces question saves into Firestore batched writes on a background thread.
+
+    Every queued document is appended to a JSON Lines spool before save
+    returns, and the spool is rewritten with whatever is still pending after
+    each committed batch, so questions queued before a crash are committed
+    on the next start.
+
+    A batch that fails ``max_attempts`` times in a row is split in half until
+    the rejected document is isolated; that document is appended to the
+    dead-letter file so the documents queued behind it are not held up.
+    Appending dead letters to the spool before a restart queues them again.
+    """
+
+    def __init__(self, spool_path: str, batch_size: int, interval: float,
+                 max_attempts: int = WRITE_MAX_ATTEMPTS, dead_letter_path: Optional[str] = None):
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_path or f"{spool_path}.dead"
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._spool = None
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            if os.path.exists(self.spool_path):
+                with open(self.spool_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            doc_id, data = json.loads(line)
+                            self._pending.append((doc_id, data))
+                        except ValueError:
+                            continue  # torn last line from a crash
+                if self._pending:
+                    logger.debug(f"✅ Replaying {len(self._pending)} spooled question saves.")
+            self._rewrite_spool()
+            self._thread = threading.Thread(target=self._run, name="firestore-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def put(self, doc_id: str, data: dict) -> None:
+        self.start()
+        with self._cond:
+            self._spool.write(json.dumps([doc_id, data], ensure_ascii=False) + "\n")
+            self._spool.flush()
+            self._pending.append((doc_id, data))
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Asks the writer to commit now and waits until nothing is pending."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending and self._thread is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.notify_all()
+                self._cond.wait(min(remaining, 0.5))
+            return not self._pending
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _rewrite_spool(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+        tmp_path = f"{self.spool_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for doc_id, data in self._pending:
+                f.write(json.dumps([doc_id, data], ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.spool_path)
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+
+    def _dead_letter(self, entries) -> None:
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for doc_id, data in entries:
+                f.write(json.dumps([doc_id, data], ensure_ascii=False) + "\n")
+
+    def _done(self, count: int, dead: bool = False) -> None:
+        with self._cond:
+            if dead:
+                self._dead_letter(self._pending[:count])
+            del self._pending[:count]
+            self._rewrite_spool()
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        delay = self.interval
+        size = self.batch_size
+        attempts = 0
+        # Documents of the last failed full batch not yet committed or dead-lettered
+        suspects = 0
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size:
+                    self._cond.wait(self.interval)
+                batch = self._pending[:size]
+            if not batch:
+                continue
+            try:
+                self._commit(batch)
+            except Exception as e:
+                attempts += 1
+                if attempts < self.max_attempts:
+                    logger.debug(f"❌ Failed to write {len(batch)} questions, will retry: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 60.0)
+                    continue
+                attempts = 0
+                suspects = suspects or len(batch)
+                if len(batch) > 1:
+                    size = len(batch) // 2
+                    logger.debug(f"❌ Batch of {len(batch)} keeps failing, retrying in halves: {e}")
+                    continue
+                logger.debug(f"❌ Giving up on question {batch[0][0]}, moved to {self.dead_letter_path}: {e}")
+                self._done(1, dead=True)
+            else:
+                attempts = 0
+                self._done(len(batch))
+            delay = self.interval
+            if suspects:
+                suspects -= len(batch)
+                if suspects <= 0:
+                    suspects = 0
+                    size = self.batch_size
+
+    @staticmethod
+    def _commit(batch) -> None:
+        db = _get_db()
+        collection = db.collection("quiz_questions")
+        write = db.batch()
+        for doc_id, data in batch:
+            write.set(collection.document(doc_id), {**data, "updated_at": firestore.SERVER_TIMESTAMP})
+        write.commit()
+
+
+_WRITES = WriteBehindQueue(WRITE_SPOOL_PATH, WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL,
+                          WRITE_MAX_ATTEMPTS, WRITE_DEAD_LETTER_PATH)
+
 
 def initialize_firebase(credential_path: str):
     if not firebase_admin._apps:
         cred = credentials.Certificate(credential_path)
         firebase_admin.initialize_app(cred)
         logger.debug("✅ Firebase initialized.")
+    _WRITES.start()
+
+
+def flush_writes(timeout: float = 30.0) -> bool:
+    """Waits until every queued save is committed; False if the timeout ran out."""
+    return _WRITES.flush(timeout)
 
 
 def are_questions_identical(q1: dict, q2: dict) -> bool:
@@ -22,14 +227,27 @@ def are_questions_identical(q1: dict, q2: dict) -> bool:
     )
 
 
+def _remember_hash(content_hash: str) -> None:
+    with _KNOWN_HASHES_LOCK:
+        _KNOWN_HASHES.add(content_hash)
+
+
 def is_duplicate_question(new_question: dict) -> bool:
+    """Checks the in-memory hash set and near-duplicate index, then makes one
+    indexed lookup on content_hash."""
+    content_hash = question_hash(new_question)
+    if content_hash in _KNOWN_HASHES:
+        return True
+    if _NEAR_DUPLICATES is not None and _NEAR_DUPLICATES.is_near_duplicate(new_question):
+        return True
     try:
-        db = firestore.client()
-        docs = db.collection("quiz_questions").stream()
-        for doc in docs:
-            existing = doc.to_dict()
-            if are_questions_identical(existing, new_question):
-                return True
+        db = _get_db()
+        query = (db.collection("quiz_questions")
+                 .where(filter=FieldFilter("content_hash", "==", content_hash))
+                 .limit(1))
+        if any(True for _ in query.stream()):
+            _remember_hash(content_hash)
+            return True
         return False
     except Exception as e:
         logger.debug(f"❌ Error checking duplicates: {e}")
@@ -37,35 +255,145 @@ def is_duplicate_question(new_question: dict) -> bool:
 
 
 def save_quiz_question(topic: str, question_data: dict) -> str:
-    # Disabled for deployment – skipping database save
+    """Queues a question under its content hash, so saving it twice is idempotent.
+
+    The write is committed in the background; the question counts as a
+    duplicate for this process as soon as this returns.
+    """
+    hashes = save_quiz_questions(topic, [question_data])
+    return hashes[0] if hashes else ""
+
+
+def save_quiz_questions(topic: str, questions: Iterable[dict]) -> List[str]:
+    """Queues many questions for batched writes and returns their content hashes."""
+    saved = []
     try:
-        db = firestore.client()
-        question_data_with_topic = {**question_data, "topic": topic}
-        doc_ref = db.collection("quiz_questions").add(question_data_with_topic)
-        return doc_ref[1].id
+        for question_data in questions:
+            content_hash = question_hash(question_data)
+            _WRITES.put(content_hash, {
+                **question_data,
+                "topic": topic or question_data.get("topic", ""),
+                "content_hash": content_hash,
+                "random_key": random.random(),
+            })
+            _remember_hash(content_hash)
+            _bump_cached_count()
+            if _NEAR_DUPLICATES is not None:
+                _NEAR_DUPLICATES.add(content_hash, question_data)
+            saved.append(content_hash)
     except Exception as e:
         logger.debug(f"❌ Failed to save question: {e}")
-        return ""
-    return ""
+    return saved
+
+
+def backfill_index_fields() -> int:
+    """Adds content_hash and random_key to documents saved before those fields existed.
+
+    Sampling and duplicate detection rely on both fields; run it once on an
+    existing collection with ``python firebase_backend.py --backfill``.
+    """
+    db = _get_db()
+    updated = 0
+    batch = db.batch()
+    for doc in db.collection("quiz_questions").stream():
+        data = doc.to_dict() or {}
+        missing = {}
+        if not data.get("content_hash"):
+            missing["content_hash"] = question_hash(data)
+        if "random_key" not in data:
+            missing["random_key"] = random.random()
+        if not missing:
+            continue
+        batch.update(doc.reference, missing)
+        updated += 1
+        if updated % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return updated
 
 
-def get_random_quiz_questions(limit=10) -> list:
+def get_random_quiz_questions(limit=10, topic: Optional[str] = None,
+                              exclude_ids: Optional[Iterable[str]] = None) -> list:
+    """Samples ``limit`` questions by seeking to a random point of the random_key index.
+
+    Only about ``limit`` documents are read (plus up to ``limit`` more to make
+    up for excluded ids), wrapping around to the start of the index when the
+    random point is near its end. Filtering by topic needs a composite
+    (topic, random_key) index.
+    """
+    exclude_ids = set(exclude_ids or ())
+    fetch = limit + min(len(exclude_ids), limit)
     try:
-        db = firestore.client()
-        docs = db.collection("quiz_questions").stream()
-        questions = [doc.to_dict() for doc in docs if doc.to_dict()]
-        return random.sample(questions, min(limit, len(questions)))
+        db = _get_db()
+        query = db.collection("quiz_questions")
+        if topic:
+            query = query.where(filter=FieldFilter("topic", "==", topic))
+        pivot = random.random()
+
+        docs = list(query.where(filter=FieldFilter("random_key", ">=", pivot))
+                    .order_by("random_key").limit(fetch).stream())
+        if len(docs) < fetch:
+            docs += list(query.where(filter=FieldFilter("random_key", "<", pivot))
+                         .order_by("random_key").limit(fetch - len(docs)).stream())
+        if len(docs) < fetch:
+            # Documents saved before random_key existed are invisible to the index
+            sampled = {doc.id for doc in docs}
+            unindexed = [doc for doc in query.limit(fetch).stream() if doc.id not in sampled]
+            if unindexed:
+                logger.warning("⚠️ Some questions have no random_key and are missed by sampling; "
+                               "run `python firebase_backend.py --backfill` to index them.")
+                docs += unindexed
+
+        questions = []
+        for doc in docs:
+            data = doc.to_dict()
+            if data and doc.id not in exclude_ids:
+                questions.append({**data, "id": doc.id})
+        random.shuffle(questions)
+        return questions[:limit]
     except Exception as e:
         logger.debug(f"❌ Failed to retrieve questions: {e}")
         return []
 
 
+def _bump_cached_count() -> None:
+    with _count_lock:
+        if _count_cache["value"] is not None:
+            _count_cache["value"] += 1
+
+
 def get_quiz_question_count() -> int:
+    """Server-side aggregation count, cached for COUNT_CACHE_TTL seconds."""
+    with _count_lock:
+        if _count_cache["value"] is not None and time.monotonic() < _count_cache["expires"]:
+            return _count_cache["value"]
     try:
-        db = firestore.client()
-        docs = db.collection("quiz_questions").stream()
-        count = sum(1 for _ in docs)
+        db = _get_db()
+        result = db.collection("quiz_questions").count(alias="total").get()
+        count = int(result[0][0].value)
+        with _count_lock:
+            _count_cache["value"] = count
+            _count_cache["expires"] = time.monotonic() + COUNT_CACHE_TTL
         return count
     except Exception as e:
         logger.debug(f"❌ Failed to count quiz questions: {e}")
         return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the Firestore question collection.")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Add content_hash and random_key to documents saved without them")
+    parser.add_argument("--credentials", default="firebase_credentials.json")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.print_help()
+        return
+
+    firebase_admin.initialize_app(credentials.Certificate(args.credentials))
+    print(f"Backfilled {backfill_index_fields()} questions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 # firebase_backend.py — snapshot-only runtime (no Firestore I/O)
 import json
+import logging
 import os
 import random
-from typing import List, Dict
+import sys
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from question_hash import question_hash
+
+logger = logging.getLogger(__name__)
 
 # Path to the snapshot; default is next to this file
 _SNAPSHOT_PATH = os.getenv(
@@ -10,22 +19,228 @@ _SNAPSHOT_PATH = os.getenv(
     os.path.join(os.path.dirname(__file__), "questions_snapshot.json")
 )
 
-# Loaded once and reused
-_SNAPSHOT_DATA: List[Dict] = []
-_LOADED = False
 
+def iter_snapshot_records(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Streams the records of a snapshot file without loading it whole.
+
+    Accepts JSON Lines (``.jsonl``) or a single JSON array, which is decoded
+    one element at a time from a sliding buffer.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer:
+            return
+        if not buffer.startswith("["):
+            raise ValueError("Snapshot is neither JSON Lines nor a JSON array")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buffer += more
+                continue
+            yield record
+            buffer = buffer[end:]
+
+
+class SnapshotWriter:
+    """Writes records one at a time as a JSON array or as JSON Lines."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.jsonl = path.endswith(".jsonl")
+        self.count = 0
+        self._f = open(self.tmp_path, "w", encoding="utf-8")
+        if not self.jsonl:
+            self._f.write("[")
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        if self.jsonl:
+            self._f.write(line + "\n")
+        else:
+            self._f.write(("," if self.count else "") + "\n  " + line)
+        self.count += 1
+
+    def close(self) -> None:
+        if not self.jsonl:
+            self._f.write("\n]\n")
+        self._f.close()
+        # Readers (and the hot-reloading snapshot backend) only ever see a complete file
+        os.replace(self.tmp_path, self.path)
+
+
+class SnapshotQuestion:
+    """Compact, read-only snapshot record; repeated strings are interned."""
+    __slots__ = ("question", "options", "answer", "explanation", "topic", "id")
+
+    def __init__(self, data: Dict):
+        options = tuple(sys.intern(o) for o in data.get("options", []))
+        self.question = data.get("question", "")
+        self.options = options
+        # The answer is one of the options, so interning makes it share that string
+        self.answer = sys.intern(data.get("answer", ""))
+        self.explanation = data.get("explanation", "")
+        self.topic = sys.intern(data.get("topic", ""))
+        self.id = data.get("content_hash") or question_hash(data)
+
+    def to_dict(self) -> Dict:
+        """Fresh dict per call, so callers may annotate it without touching the store."""
+        return {
+            "question": self.question,
+            "options": list(self.options),
+            "answer": self.answer,
+            "explanation": self.explanation,
+            "topic": self.topic,
+            "id": self.id,
+        }
+
+
+class SnapshotStore:
+    """Immutable, topic-indexed view of one snapshot file."""
+
+    def __init__(self, records: List[SnapshotQuestion]):
+        self.records: Tuple[SnapshotQuestion, ...] = tuple(records)
+        by_topic: Dict[str, array] = {}
+        for i, record in enumerate(self.records):
+            by_topic.setdefault(record.topic, array("I")).append(i)
+        self.by_topic = by_topic
+        self.ids: Dict[str, int] = {record.id: i for i, record in enumerate(self.records)}
+
+    @classmethod
+    def load(cls, path: str) -> "SnapshotStore":
+        records = []
+        seen = set()
+        try:
+            # Stream records so the parsed dicts never all exist at once
+            for data in iter_snapshot_records(path):
+                record = SnapshotQuestion(data)
+                if record.id not in seen:
+                    seen.add(record.id)
+                    records.append(record)
+        except FileNotFoundError:
+            # No snapshot shipped; keep empty so the app still runs
+            pass
+        return cls(records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def sample(self, limit: int, topic: Optional[str] = None,
+               exclude_ids: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Samples up to ``limit`` questions in O(limit) expected time.
 
-def _ensure_loaded():
-    global _LOADED, _SNAPSHOT_DATA
-    if _LOADED:
-        return
+        Indices are drawn at random from the topic's index and rejected if
+        excluded or already drawn; only when most of the pool is excluded does
+        it fall back to filtering the pool.
+        """
+        pool = self.by_topic.get(topic, ()) if topic else range(len(self.records))
+        excluded = {self.ids[i] for i in (exclude_ids or ()) if i in self.ids}
+        available = len(pool) - sum(1 for i in excluded if not topic or self.records[i].topic == topic)
+        limit = min(limit, available)
+        if limit <= 0:
+            return []
+
+        chosen: List[int] = []
+        if available >= 2 * limit:
+            picked = set()
+            while len(chosen) < limit:
+                i = pool[random.randrange(len(pool))]
+                if i not in picked and i not in excluded:
+                    picked.add(i)
+                    chosen.append(i)
+        else:
+            chosen = random.sample([i for i in pool if i not in excluded], limit)
+        return [self.records[i].to_dict() for i in chosen]
+
+    def is_duplicate(self, question: Dict) -> bool:
+        return question_hash(question) in self.ids
+
+
+# Seconds between checks of the snapshot file for a newer export
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", "5"))
+
+# Current store and the (inode, mtime, size) of the file it was loaded from.
+# The store is immutable and replaced by a single assignment, so readers that
+# already hold a reference keep a consistent snapshot during a reload.
+_STORE: Optional[SnapshotStore] = None
+_STORE_STAMP: Optional[Tuple[int, int, int]] = None
+_LOAD_LOCK = threading.Lock()
+_next_check = 0.0
+_reloading = False
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _load_and_swap(stamp: Optional[Tuple[int, int, int]]) -> None:
+    global _STORE, _STORE_STAMP, _reloading
     try:
-        with open(_SNAPSHOT_PATH, "r", encoding="utf-8") as f:
-            _SNAPSHOT_DATA = json.load(f)
-    except FileNotFoundError:
-        # No snapshot shipped; keep empty so the app still runs
-        _SNAPSHOT_DATA = []
-    _LOADED = True
+        store = SnapshotStore.load(_SNAPSHOT_PATH)
+        _STORE, _STORE_STAMP = store, stamp
+        logger.debug(f"✅ Loaded snapshot with {len(store)} questions.")
+    except (OSError, ValueError) as e:
+        # Keep serving the previous snapshot, e.g. while an export is half written
+        logger.debug(f"❌ Failed to reload snapshot: {e}")
+    finally:
+        _reloading = False
+
+
+def reload_snapshot(wait: bool = True) -> None:
+    """Reloads the snapshot file, in the background unless ``wait`` is set."""
+    global _reloading
+    with _LOAD_LOCK:
+        if _reloading:
+            return
+        _reloading = True
+    stamp = _file_stamp(_SNAPSHOT_PATH)
+    if wait:
+        _load_and_swap(stamp)
+    else:
+        threading.Thread(target=_load_and_swap, args=(stamp,), name="snapshot-reload", daemon=True).start()
+
+
+def _ensure_loaded() -> SnapshotStore:
+    """Returns the current store, starting a background reload if the file changed."""
+    global _STORE, _STORE_STAMP, _next_check
+    store = _STORE
+    if store is None:
+        with _LOAD_LOCK:
+            if _STORE is None:
+                _STORE_STAMP = _file_stamp(_SNAPSHOT_PATH)
+                _STORE = SnapshotStore.load(_SNAPSHOT_PATH)
+                _next_check = time.monotonic() + SNAPSHOT_CHECK_INTERVAL
+            return _STORE
+
+    now = time.monotonic()
+    if now >= _next_check:
+        _next_check = now + SNAPSHOT_CHECK_INTERVAL
+        stamp = _file_stamp(_SNAPSHOT_PATH)
+        if stamp is not None and stamp != _STORE_STAMP:
+            reload_snapshot(wait=False)
+    return store
 
 
 def initialize_firebase(credential_path: str):
@@ -43,8 +258,13 @@ def are_questions_identical(q1: dict, q2: dict) -> bool:
 
 
 def is_duplicate_question(new_question: dict) -> bool:
-    """No DB reads in snapshot mode."""
-    return False
+    """Content-hash lookup against the snapshot (no DB reads).
+
+    There is no near-duplicate check: saving is disabled in snapshot mode, so
+    the answer only decides whether a no-op save is skipped, and indexing the
+    whole snapshot would stall the first request after every reload.
+    """
+    return _ensure_loaded().is_duplicate(new_question)
 
 
 def save_quiz_question(topic: str, question_data: dict) -> str:
@@ -52,12 +272,15 @@ def save_quiz_question(topic: str, question_data: dict) -> str:
     return ""
 
 
-def get_random_quiz_questions(limit=10) -> list:
-    _ensure_loaded()
-    n = min(limit, len(_SNAPSHOT_DATA))
-    return random.sample(_SNAPSHOT_DATA, n)
+def save_quiz_questions(topic: str, questions: Iterable[dict]) -> List[str]:
+    """Disabled in snapshot mode (no writes)."""
+    return []
+
+
+def get_random_quiz_questions(limit=10, topic: Optional[str] = None,
+                              exclude_ids: Optional[Iterable[str]] = None) -> list:
+    return _ensure_loaded().sample(limit, topic, exclude_ids)
 
 
 def get_quiz_question_count() -> int:
-    _ensure_loaded()
-    return len(_SNAPSHOT_DATA)
+    return len(_ensure_loaded())
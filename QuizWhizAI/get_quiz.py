@@ -1,13 +1,24 @@
+import asyncio
 import json
 import logging
 import random
+import threading
+import time
+from collections import OrderedDict, deque
 from os import getenv
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Deque, Dict, List, Mapping, Optional, Tuple
 
-from openai import OpenAI, OpenAIError
+from openai import OpenAIError
 from openai.types.chat import ChatCompletionMessageParam
 from pydantic import BaseModel, ValidationError
 
+import metrics
+from create_context_from_PDF import estimate_tokens
+from openai_client import acreate_chat_completion, create_chat_completion
+from question_cache import get_question_cache, record_lookup
+from rank_context_chunks import select_context_chunk
+from response_repair import extract_json, record_repairs, repair_question
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,6 +29,7 @@ class QuizQuestion(BaseModel):
     explanation: str
 
 
+# Fixed prefix sent with every request; per-session state lives in ConversationMemory
 chat_history: List[ChatCompletionMessageParam] = [
     {
         "role": "system",
@@ -46,13 +58,113 @@ chat_history: List[ChatCompletionMessageParam] = [
 ]
 
 
-def get_quiz_from_topic(topic: str, api_key: str, context_chunks: Optional[List[str]] = None) -> Optional[
-    Dict[str, str]]:
-    context_chunks = context_chunks or []
-    global chat_history
+# Questions remembered per session for dedup steering, bounded by count and tokens
+MEMORY_MAX_QUESTIONS = int(getenv("MEMORY_MAX_QUESTIONS", "30"))
+MEMORY_TOKEN_BUDGET = int(getenv("MEMORY_TOKEN_BUDGET", "600"))
+# Sessions remembered at once; the least recently active one is forgotten first
+MEMORY_MAX_SESSIONS = int(getenv("MEMORY_MAX_SESSIONS", "256"))
+
+
+class ConversationMemory:
+    """Bounded, thread-safe memory of already-asked questions per session.
+
+    Instead of replaying every previous prompt and reply, each request is sent
+    as ``chat_history`` (the fixed system prompt and example) plus one user
+    message that lists the session's most recent questions, trimmed to
+    ``token_budget``, so the model can avoid repeating them. Prompt size is
+    therefore constant no matter how many questions have been generated.
+    """
+
+    def __init__(self, max_questions: int = MEMORY_MAX_QUESTIONS,
+                 token_budget: int = MEMORY_TOKEN_BUDGET,
+                 max_sessions: int = MEMORY_MAX_SESSIONS):
+        self.max_questions = max_questions
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Deque[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "prompt_tokens_last": 0,
+            "prompt_tokens_max": 0,
+            "prompt_tokens_total": 0,
+        }
+
+    def remember(self, session_id: str, questions: List[str]) -> None:
+        with self._lock:
+            asked = self._sessions.get(session_id)
+            if asked is None:
+                asked = self._sessions[session_id] = deque(maxlen=self.max_questions)
+            self._sessions.move_to_end(session_id)
+            asked.extend(q.strip() for q in questions if q)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def recent_questions(self, session_id: str) -> List[str]:
+        """Most recent questions of a session, newest first, within the token budget."""
+        with self._lock:
+            asked = list(self._sessions.get(session_id, ()))
+        recent, used = [], 0
+        for question in reversed(asked):
+            cost = estimate_tokens(question)
+            if used + cost > self.token_budget:
+                break
+            recent.append(question)
+            used += cost
+        return recent
+
+    def build_messages(self, session_id: str, prompt: str) -> List[ChatCompletionMessageParam]:
+        recent = self.recent_questions(session_id)
+        if recent:
+            avoid = "\n".join(f"- {q}" for q in recent)
+            prompt = f"{prompt}\n\nDo not repeat any of these already-asked questions:\n{avoid}"
+
+        messages = chat_history + [{"role": "user", "content": prompt}]
+        self._record_prompt(sum(estimate_tokens(m["content"]) for m in messages))
+        return messages
+
+    def _record_prompt(self, tokens: int) -> None:
+        with self._lock:
+            self._metrics["requests"] += 1
+            self._metrics["prompt_tokens_last"] = tokens
+            self._metrics["prompt_tokens_max"] = max(self._metrics["prompt_tokens_max"], tokens)
+            self._metrics["prompt_tokens_total"] += tokens
+        metrics.incr("prompt_tokens_estimated", tokens)
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._metrics, "sessions": len(self._sessions)}
+
+
+conversation_memory = ConversationMemory()
+
+
+# Sampling parameters shared by every generation path
+COMPLETION_PARAMS = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "presence_penalty": 0.4,
+    "frequency_penalty": 0.3,
+}
+# Ask for a JSON object via the API's JSON mode (set OPENAI_JSON_MODE=0 for models without it)
+if getenv("OPENAI_JSON_MODE", "1") == "1":
+    COMPLETION_PARAMS["response_format"] = {"type": "json_object"}
+
+# Bump when the prompts change so cached questions from older prompts are not served
+PROMPT_TEMPLATE_VERSION = 1
+
+# Follow-up requests asking the model to fix a reply the repair stage could not salvage
+REPAIR_MAX_RETRIES = int(getenv("REPAIR_MAX_RETRIES", "1"))
 
-    client = OpenAI(api_key=api_key)
-    context_text = context_chunks[0] if context_chunks else ""
+
+def _build_question_messages(topic: str, context_chunks: List[str],
+                             session_id: str) -> List[ChatCompletionMessageParam]:
+    started = time.perf_counter()
+    context_text = select_context_chunk(topic, context_chunks)
 
     prompt = f"""
     Use the following study material to create a quiz question about "{topic}".
@@ -60,50 +172,260 @@ def get_quiz_from_topic(topic: str, api_key: str, context_chunks: Optional[List[
     Study Material:
     {context_text}
 
-    Return a Python dictionary with keys: "question", "options", "answer", "explanation".
+    Return a JSON object with keys: "question", "options", "answer", "explanation".
     """
 
-    current_user_message: ChatCompletionMessageParam = {
-        "role": "user",
-        "content": prompt.strip(),
-    }
+    messages = conversation_memory.build_messages(session_id, prompt.strip())
+    metrics.observe("prompt_build", time.perf_counter() - started)
+    return messages
 
-    current_chat = chat_history + [current_user_message]
 
+def _parse_question(content: str) -> Dict[str, str]:
+    """Validates a reply, first stripping fences and prose around the JSON and
+    mapping a near-miss answer onto its option."""
     try:
-        MODEL_ID = getenv("MODEL_ID", "chatgpt-4o-latest")
-        response = client.chat.completions.create(
-            model=MODEL_ID,
-            messages=current_chat,
-            temperature=0.7,
-            top_p=0.95,
-            presence_penalty=0.4,
-            frequency_penalty=0.3
-        )
-
-        content = response.choices[0].message.content
-        logger.debug(f"Response:\n{content}")
-
-        assistant_message: ChatCompletionMessageParam = {
-            "role": "assistant",
-            "content": content
-        }
-        chat_history.append(current_user_message)
-        chat_history.append(assistant_message)
+        with metrics.span("validate"):
+            data, repairs = extract_json(content)
+            data, answer_repairs = repair_question(data)
+            question = _finalize_question(QuizQuestion.parse_obj(data))
+    except (ValidationError, ValueError, TypeError):
+        metrics.incr("validation_failures")
+        raise
+    record_repairs(repairs + answer_repairs)
+    return question
+
+
+def _repair_request(messages: List[ChatCompletionMessageParam], content: str,
+                    error: Exception) -> List[ChatCompletionMessageParam]:
+    """The original request plus the unusable reply and what was wrong with it."""
+    return messages + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": (
+            f"That reply could not be used: {str(error)[:300]}\n"
+            'Reply with only the corrected JSON object with keys "question", "options", '
+            '"answer", "explanation", where "answer" is exactly one of the "options".'
+        )},
+    ]
+
+
+def _handle_reply(response, attempt: int, current_chat: List[ChatCompletionMessageParam]
+                  ) -> Tuple[Optional[Dict[str, str]], List[ChatCompletionMessageParam]]:
+    """One attempt of the repair loop: the validated question, or None and the
+    messages asking the model to fix its reply. Raises on the last attempt."""
+    content = response.choices[0].message.content or ""
+    logger.debug(f"Response:\n{content}")
+    try:
+        question = _parse_question(content)
+    except (ValidationError, ValueError, TypeError) as e:
+        if attempt == REPAIR_MAX_RETRIES:
+            raise
+        metrics.incr("repair_retries")
+        return None, _repair_request(current_chat, content, e)
+    if attempt:
+        metrics.incr("repair_retry_successes")
+    return question, current_chat
+
 
-        quiz_question = QuizQuestion.parse_raw(content)
+def _accept_question(question: Dict[str, str], session_id: str, topic: str, model: str,
+                     context_chunks: List[str]) -> Dict[str, str]:
+    conversation_memory.remember(session_id, [question["question"]])
+    metrics.incr("questions_generated")
+    _cache_questions(model, topic, context_chunks, session_id, [question])
+    return question
 
-        options = quiz_question.options
-        correct_answer = quiz_question.answer
 
-        if correct_answer not in options:
-            raise ValueError("Answer is not among the provided options.")
+def _cache_questions(model: str, topic: str, context_chunks: List[str], session_id: str,
+                     questions: List[Dict[str, str]]) -> None:
+    """Adds generated questions to the cache pool, as already served to this session."""
+    cache = get_question_cache()
+    if cache is not None and questions:
+        cache.add(model, topic, PROMPT_TEMPLATE_VERSION, context_chunks, questions)
+        cache.mark_served(session_id, questions)
+
+
+def get_quiz_from_topic(topic: str, api_key: str, context_chunks: Optional[List[str]] = None,
+                        session_id: str = "default") -> Optional[Dict[str, str]]:
+    context_chunks = context_chunks or []
+    current_chat = _build_question_messages(topic, context_chunks, session_id)
+
+    try:
+        MODEL_ID = getenv("MODEL_ID", "chatgpt-4o-latest")
+        messages = current_chat
+        for attempt in range(REPAIR_MAX_RETRIES + 1):
+            with metrics.span("openai_call"):
+                response = create_chat_completion(api_key, model=MODEL_ID, messages=messages,
+                                                  **COMPLETION_PARAMS)
+            question, messages = _handle_reply(response, attempt, current_chat)
+            if question is not None:
+                return _accept_question(question, session_id, topic, MODEL_ID, context_chunks)
+
+    except (OpenAIError, json.JSONDecodeError, ValidationError, ValueError, TypeError) as e:
+        metrics.incr("generation_failures", reason=type(e).__name__)
+        logger.debug(f"Error: {e}")
+        return None
+
 
-        random.shuffle(options)
-        quiz_question.options = options
+async def get_quiz_from_topic_async(topic: str, api_key: str, context_chunks: Optional[List[str]] = None,
+                                    session_id: str = "default") -> Optional[Dict[str, str]]:
+    """Asyncio counterpart of get_quiz_from_topic with the same validation, repair and shuffling."""
+    context_chunks = context_chunks or []
+    current_chat = _build_question_messages(topic, context_chunks, session_id)
 
-        return quiz_question.dict()
+    try:
+        MODEL_ID = getenv("MODEL_ID", "chatgpt-4o-latest")
+        messages = current_chat
+        for attempt in range(REPAIR_MAX_RETRIES + 1):
+            with metrics.span("openai_call"):
+                response = await acreate_chat_completion(api_key, model=MODEL_ID, messages=messages,
+                                                         **COMPLETION_PARAMS)
+            question, messages = _handle_reply(response, attempt, current_chat)
+            if question is not None:
+                return _accept_question(question, session_id, topic, MODEL_ID, context_chunks)
 
-    except (OpenAIError, json.JSONDecodeError, ValidationError, ValueError) as e:
+    except (OpenAIError, json.JSONDecodeError, ValidationError, ValueError, TypeError) as e:
+        metrics.incr("generation_failures", reason=type(e).__name__)
         logger.debug(f"Error: {e}")
         return None
+
+
+async def gather_quizzes(topics: List[str], n: int, concurrency: int, api_key: str,
+                         topic_contexts: Optional[Mapping[str, List[str]]] = None,
+                         session_id: str = "default") -> AsyncIterator[Tuple[str, Optional[Dict[str, str]]]]:
+    """Generates ``n`` questions per topic, at most ``concurrency`` at a time.
+
+    Yields ``(topic, question)`` pairs in completion order; ``question`` is None
+    for a failed generation.
+    """
+    topic_contexts = topic_contexts or {}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def generate(topic: str) -> Tuple[str, Optional[Dict[str, str]]]:
+        async with semaphore:
+            return topic, await get_quiz_from_topic_async(
+                topic, api_key, topic_contexts.get(topic, []), session_id)
+
+    tasks = [asyncio.ensure_future(generate(topic)) for topic in topics for _ in range(n)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _finalize_question(quiz_question: QuizQuestion) -> Dict[str, str]:
+    """Checks the answer is one of the options and shuffles the options."""
+    options = quiz_question.options
+    correct_answer = quiz_question.answer
+
+    if correct_answer not in options:
+        raise ValueError("Answer is not among the provided options.")
+
+    random.shuffle(options)
+    quiz_question.options = options
+
+    return quiz_question.dict()
+
+
+# Retries for a batch that came back with fewer valid questions than requested
+BATCH_MAX_RETRIES = 1
+# Distinct study-material chunks a batch prompt is grounded on
+BATCH_MAX_CHUNKS = 3
+
+
+def _parse_question_batch(content: str) -> List[Dict[str, str]]:
+    """Validates every item of a batch response, repairing what it can and
+    dropping the rest."""
+    data, repairs = extract_json(content)
+    record_repairs(repairs)
+    items = data.get("questions", []) if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("Batch response does not contain a list of questions.")
+
+    questions = []
+    for item in items:
+        try:
+            item, answer_repairs = repair_question(item)
+            questions.append(_finalize_question(QuizQuestion.parse_obj(item)))
+            record_repairs(answer_repairs)
+        except (ValidationError, ValueError, TypeError) as e:
+            metrics.incr("validation_failures")
+            logger.debug(f"Dropping invalid batch item: {e}")
+    metrics.incr("questions_generated", len(questions))
+    return questions
+
+
+def get_quizzes_from_topic(topic: str, api_key: str, context_chunks: Optional[List[str]] = None,
+                           n: int = 5, session_id: str = "default") -> List[Dict[str, str]]:
+    """Generates up to ``n`` validated quiz questions with one chat completion.
+
+    Invalid items are dropped; if fewer than ``n`` remain, the missing ones are
+    requested again up to BATCH_MAX_RETRIES times.
+    """
+    context_chunks = context_chunks or []
+    MODEL_ID = getenv("MODEL_ID", "chatgpt-4o-latest")
+    questions: List[Dict[str, str]] = []
+
+    for _ in range(1 + BATCH_MAX_RETRIES):
+        missing = n - len(questions)
+        if missing <= 0:
+            break
+
+        started = time.perf_counter()
+        context_texts = []
+        for _ in range(min(missing, BATCH_MAX_CHUNKS, len(context_chunks))):
+            chunk = select_context_chunk(topic, context_chunks)
+            if chunk not in context_texts:
+                context_texts.append(chunk)
+        context_text = "\n\n---\n\n".join(context_texts)
+
+        prompt = f"""
+    Use the following study material to create {missing} different quiz questions about "{topic}".
+
+    Study Material:
+    {context_text}
+
+    Return a JSON object with a single key "questions" whose value is a list of {missing} objects,
+    each with keys: "question", "options", "answer", "explanation".
+    """
+
+        messages = conversation_memory.build_messages(session_id, prompt.strip())
+        metrics.observe("prompt_build", time.perf_counter() - started)
+
+        try:
+            with metrics.span("openai_call"):
+                response = create_chat_completion(api_key, model=MODEL_ID, messages=messages,
+                                                  **COMPLETION_PARAMS)
+
+            content = response.choices[0].message.content or ""
+            logger.debug(f"Batch response:\n{content}")
+
+            with metrics.span("validate"):
+                batch = _parse_question_batch(content)[:missing]
+            conversation_memory.remember(session_id, [q["question"] for q in batch])
+            _cache_questions(MODEL_ID, topic, context_chunks, session_id, batch)
+            questions.extend(batch)
+
+        except (OpenAIError, json.JSONDecodeError, ValueError, TypeError) as e:
+            metrics.incr("generation_failures", reason=type(e).__name__)
+            logger.debug(f"Error: {e}")
+
+    return questions
+
+
+def get_quizzes_for_session(topic: str, api_key: str, context_chunks: Optional[List[str]] = None,
+                            n: int = 5, session_id: str = "default") -> List[Dict[str, str]]:
+    """Serves ``n`` questions, taking ones this session has not seen from the
+    generation cache first and generating only the rest."""
+    cache = get_question_cache()
+    if cache is None:
+        return get_quizzes_from_topic(topic, api_key, context_chunks, n, session_id)
+
+    MODEL_ID = getenv("MODEL_ID", "chatgpt-4o-latest")
+    questions = cache.take(MODEL_ID, topic, PROMPT_TEMPLATE_VERSION, context_chunks or [], session_id, n)
+    record_lookup(len(questions), n - len(questions))
+    if questions:
+        conversation_memory.remember(session_id, [q["question"] for q in questions])
+    if len(questions) < n:
+        questions += get_quizzes_from_topic(topic, api_key, context_chunks, n - len(questions), session_id)
+    return questions
@@ -1,30 +1,113 @@
+import hmac
+import logging
 import os
 import time
+import uuid
 
 import streamlit as st
 from dotenv import load_dotenv
 
-from create_context_from_PDF import load_topic_contexts
-from export_quiz_to_PDF import generate_quiz_pdf
-from firebase_backend import (
+from create_context_from_PDF import get_topic_context_store, load_topic_contexts
+from export_quiz_to_PDF import generate_quiz_pdf_bytes
+from storage_backend import (
     initialize_firebase, save_quiz_question, get_random_quiz_questions,
     get_quiz_question_count, is_duplicate_question
 )
-from get_quiz import get_quiz_from_topic
+from get_quiz import get_quiz_from_topic, get_quizzes_for_session
+import metrics
+from question_prefetch import QuestionPrefetcher
+from startup_report import record_script_run
 
-# --- Initialize Firebase ---
-initialize_firebase("firebase_credentials.json")
+_run_started = time.perf_counter()
 
 # --- Constants ---
 MAX_QUESTIONS = 10
+QUESTION_TIME_LIMIT = 30  # seconds
+COUNT_REFRESH_SECONDS = 60
+# Secret that lets ?reload=<token> rebuild the cached resources; unset disables reloading
+RELOAD_TOKEN = os.getenv("RELOAD_TOKEN", "")
 
-# --- Load Environment ---
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+TOPICS = [
+    "Chapter01 Introduction to Computers and Programming", "Chapter02 Input, Processing, and Output",
+    "Chapter03 Decision Structures and Boolean Logic", "Chapter04 Repetition Structures",
+    "Chapter05 Functions", "Chapter06 Files and Exceptions", "Chapter07 Lists and Tuples",
+    "Chapter08 More About Strings", "Chapter09 Dictionaries and Sets"
+]
+
+logger = logging.getLogger(__name__)
+
+
+# --- Process-wide resources (built once, shared by all sessions and reruns) ---
+
+@st.cache_resource
+def init_backend():
+    initialize_firebase("firebase_credentials.json")
+    metrics.start_exporters()
+    return True
+
+
+@st.cache_resource
+def load_api_key():
+    # override=True so a reload picks up a key changed in .env
+    load_dotenv(override=True)
+    return os.getenv("OPENAI_API_KEY")
+
+
+@st.cache_resource
+def get_topic_contexts():
+    return load_topic_contexts(TOPICS)
+
+
+@st.cache_data(ttl=COUNT_REFRESH_SECONDS, show_spinner=False)
+def cached_question_count():
+    return get_quiz_question_count()
+
+
+def invalidate_resources():
+    """Drops every cached resource, e.g. after new PDFs or a new OpenAI key in .env
+    were deployed. The Firebase app stays initialised for the life of the process."""
+    init_backend.clear()
+    load_api_key.clear()
+    get_topic_contexts.clear()
+    cached_question_count.clear()
+    get_topic_context_store().invalidate()
+
+
+# Opening the app with ?reload=<RELOAD_TOKEN> rebuilds the cached resources for every session
+reload_token = st.query_params.get("reload")
+if reload_token is not None:
+    if RELOAD_TOKEN and hmac.compare_digest(reload_token, RELOAD_TOKEN):
+        invalidate_resources()
+    del st.query_params["reload"]
+
+init_backend()
+api_key = load_api_key()
 
 
 # --- FUNCTION DEFINITIONS ---
 
+def stop_prefetching():
+    """Cancels background question generation for the current quiz, if any."""
+    prefetcher = st.session_state.get("prefetcher")
+    if prefetcher is not None:
+        prefetcher.close()
+    st.session_state.prefetcher = None
+
+
+def sample_unseen_questions(topic, limit=10):
+    """Samples stored questions this session has not seen yet for ``topic``
+    (None for all chapters), starting over once every question has been shown."""
+    seen = st.session_state.seen_question_ids.setdefault(topic, set())
+    questions = get_random_quiz_questions(limit, topic=topic, exclude_ids=seen)
+    if len(questions) < limit and seen:
+        # Too few unseen questions left; top up from the ones shown before
+        seen.clear()
+        seen.update(q["id"] for q in questions if q.get("id"))
+        questions += get_random_quiz_questions(limit - len(questions), topic=topic, exclude_ids=seen)
+    seen.update(q["id"] for q in questions if q.get("id"))
+    return questions
+
+
 def start_quiz(topic, save_to_db, topic_contexts, load_random=False):
     """Resets the quiz state and loads the first question(s)."""
     # Reset all relevant session state variables
@@ -36,12 +119,26 @@ def start_quiz(topic, save_to_db, topic_contexts, load_random=False):
     st.session_state.quiz_complete = False
     st.session_state.quiz_data = []
     st.session_state.show_timer_expired_warning = False
+    stop_prefetching()
 
     if load_random:
-        st.session_state.questions = get_random_quiz_questions(10)
+        questions = sample_unseen_questions(topic)
+        if not questions:
+            # No stored questions for this chapter yet; fall back to all chapters
+            questions = sample_unseen_questions(None)
+        if not questions:
+            st.info("There are no stored questions yet. Start a new quiz to generate some.")
+        st.session_state.questions = questions
         st.session_state.max_questions_override = len(st.session_state.questions)
     else:
-        q = get_quiz_from_topic(topic, api_key, topic_contexts.get(topic, []))
+        context_chunks = topic_contexts.get(topic, [])
+        session_id = st.session_state.session_id
+        st.session_state.prefetcher = QuestionPrefetcher(
+            topic,
+            lambda n: get_quizzes_for_session(topic, api_key, context_chunks, n, session_id=session_id),
+            budget=MAX_QUESTIONS,
+        )
+        q = st.session_state.prefetcher.get()
         if q:
             st.session_state.questions.append(q)
             if save_to_db and not is_duplicate_question(q):
@@ -82,7 +179,7 @@ def display_question(topic, save_to_db, topic_contexts):
         st.session_state.last_rendered_question = i
 
     elapsed = int(time.time() - st.session_state.question_start_time)
-    remaining = 30 - elapsed
+    remaining = QUESTION_TIME_LIMIT - elapsed
 
     if remaining <= 0 and not st.session_state.timer_expired:
         st.session_state.timer_expired = True
@@ -96,9 +193,11 @@ def display_question(topic, save_to_db, topic_contexts):
         st.session_state.show_timer_expired_warning = False
         st.rerun()
 
-    if remaining > 0:
-        st.markdown(f"⏳ **Time left: {remaining} seconds**")
-        st.progress((30 - remaining) / 30)
+    already_answered = i in st.session_state.answers
+
+    if remaining > 0 and not already_answered and not st.session_state.timer_expired:
+        render_countdown(i, remaining)
+        watch_timer(i, remaining)
 
     st.markdown(f"**QUESTION {i + 1}.**")
     if "```" in q["question"]:
@@ -108,7 +207,6 @@ def display_question(topic, save_to_db, topic_contexts):
     else:
         st.markdown(q["question"])
 
-    already_answered = i in st.session_state.answers
     options_to_display = q["options"]
 
     if already_answered:
@@ -149,14 +247,60 @@ def display_question(topic, save_to_db, topic_contexts):
             else:
                 st.write(q["explanation"])
 
-    if remaining > 0 and not already_answered and not st.session_state.timer_expired:
-        time.sleep(1)
-        st.rerun()
+
+def render_countdown(i, remaining):
+    """Draws the countdown in the browser, so ticking needs no server reruns."""
+    st.iframe(f"""
+    <div style="font-family: 'Source Sans Pro', sans-serif; font-size: 16px;">
+        ⏳ <b>Time left: <span id="left-{i}">{remaining}</span> seconds</b>
+        <progress id="bar-{i}" max="{QUESTION_TIME_LIMIT}" value="{QUESTION_TIME_LIMIT - remaining}"
+                  style="width: 100%;"></progress>
+    </div>
+    <script>
+        const end = Date.now() + {remaining} * 1000;
+        const tick = () => {{
+            const left = Math.max(0, Math.ceil((end - Date.now()) / 1000));
+            document.getElementById("left-{i}").textContent = left;
+            document.getElementById("bar-{i}").value = {QUESTION_TIME_LIMIT} - left;
+            if (left > 0) setTimeout(tick, 250);
+        }};
+        tick();
+    </script>
+    """, height=60)
+
+
+def watch_timer(i, remaining):
+    """Fragment that reruns once when question ``i`` runs out of time.
+
+    Only this fragment executes when the timer fires; it triggers a full
+    rerun only if the question is still open at that point.
+    """
+    @st.fragment(run_every=remaining)
+    def timer_watch():
+        if not st.session_state.in_full_run:
+            count_script_run("fragment")
+        if (st.session_state.current_question != i or i in st.session_state.answers
+                or st.session_state.timer_expired):
+            return
+        if time.time() - st.session_state.question_start_time >= QUESTION_TIME_LIMIT:
+            st.session_state.timer_expired = True
+            st.session_state.show_timer_expired_warning = True
+            st.rerun()
+
+    timer_watch()
+
+
+def count_script_run(kind="full"):
+    """Counts server executions (full runs and fragment runs) for the current question."""
+    st.session_state.question_runs += 1
+    metrics.incr("script_executions", kind=kind)
 
 
 def next_question(topic, save_to_db, topic_contexts):
     """Moves to the next question or ends the quiz."""
     i = st.session_state.current_question
+    logger.debug(f"Question {i + 1} took {st.session_state.question_runs} server executions.")
+    st.session_state.question_runs = 0
 
     if i not in st.session_state.answers:
         st.session_state.wrong_answers += 1
@@ -171,6 +315,7 @@ def next_question(topic, save_to_db, topic_contexts):
 
     if i + 1 >= max_q:
         st.session_state.quiz_complete = True
+        stop_prefetching()
         return
 
     st.session_state.current_question += 1
@@ -179,7 +324,12 @@ def next_question(topic, save_to_db, topic_contexts):
     st.session_state.last_rendered_question = -1
 
     if st.session_state.current_question >= len(st.session_state.questions):
-        q_next = get_quiz_from_topic(topic, api_key, topic_contexts.get(topic, []))
+        prefetcher = st.session_state.get("prefetcher")
+        if prefetcher is not None:
+            q_next = prefetcher.get()
+        else:
+            q_next = get_quiz_from_topic(topic, api_key, topic_contexts.get(topic, []),
+                                         session_id=st.session_state.session_id)
         if q_next:
             st.session_state.questions.append(q_next)
             if save_to_db and not is_duplicate_question(q_next):
@@ -217,9 +367,12 @@ def show_summary(topic, save_to_db, topic_contexts):
     - 🏁 Final Score: **{score:.1f}%**
     """)
 
-    if st.button("Export PDF"):
-        generate_quiz_pdf(st.session_state.quiz_data)
-        st.success("Quiz exported!")
+    st.download_button(
+        "Export PDF",
+        data=generate_quiz_pdf_bytes(st.session_state.quiz_data),
+        file_name="quiz.pdf",
+        mime="application/pdf",
+    )
 
 
 # --- Session State Initialization ---
@@ -229,7 +382,8 @@ def init_state():
         "wrong_answers": 0, "quiz_complete": False, "show_timer_expired_warning": False,
         "question_start_time": time.time(), "timer_expired": False,
         "max_questions_override": MAX_QUESTIONS, "quiz_data": [],
-        "app_closed": False
+        "app_closed": False, "prefetcher": None, "session_id": uuid.uuid4().hex,
+        "seen_question_ids": {}, "question_runs": 0, "in_full_run": False
     }
     for key, default in defaults.items():
         if key not in st.session_state:
@@ -237,6 +391,8 @@ def init_state():
 
 
 init_state()
+count_script_run()
+st.session_state.in_full_run = True
 
 # --- App Layout & Logic ---
 
@@ -255,24 +411,17 @@ if st.session_state.get("app_closed", False):
         st.rerun()
     st.stop()
 
-# Topics
-topics = [
-    "Chapter01 Introduction to Computers and Programming", "Chapter02 Input, Processing, and Output",
-    "Chapter03 Decision Structures and Boolean Logic", "Chapter04 Repetition Structures",
-    "Chapter05 Functions", "Chapter06 Files and Exceptions", "Chapter07 Lists and Tuples",
-    "Chapter08 More About Strings", "Chapter09 Dictionaries and Sets"
-]
-topic_contexts = load_topic_contexts(topics)
+topic_contexts = get_topic_contexts()
 
 # Sidebar
 with st.sidebar.expander("Please select a topic", expanded=True):
-    topic = st.radio("Topic", topics, index=0, label_visibility="collapsed")
+    topic = st.radio("Topic", TOPICS, index=0, label_visibility="collapsed")
 
 save_to_db = True
 st.sidebar.checkbox("📂 Save questions to DB", value=True)
 # disabled because of synch problems when deployed
 
-st.sidebar.info(f"📦 Total number of quiz questions in DB: {get_quiz_question_count()}")
+st.sidebar.info(f"📦 Total number of quiz questions in DB: {cached_question_count()}")
 
 quiz_in_progress = bool(st.session_state.questions and not st.session_state.quiz_complete)
 
@@ -289,6 +438,7 @@ if st.sidebar.button("🎲 Load 10 Random Questions (from snapshot)", disabled=q
 close_disabled = quiz_in_progress or st.session_state.app_closed
 
 if st.sidebar.button("❌ Close App", disabled=close_disabled):
+    stop_prefetching()
     st.session_state.app_closed = True
     st.rerun()
 
@@ -312,3 +462,7 @@ with col_main:
         if st.session_state.questions:
             st.write(f"Right answers: {st.session_state.right_answers}")
             st.write(f"Wrong answers: {st.session_state.wrong_answers}")
+
+# Fragment-only reruns (the timer watcher) do not execute the lines above
+st.session_state.in_full_run = False
+record_script_run(time.perf_counter() - _run_started)
@@ -0,0 +1,190 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Serve Prometheus text on this port (0 disables)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Append a JSON snapshot of all metrics to this file every METRICS_LOG_INTERVAL seconds
+METRICS_LOG = os.getenv("METRICS_LOG", "")
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "60"))
+# Comma-separated span names to run under cProfile ("all" for every span)
+PROFILE_SPANS = {s.strip() for s in os.getenv("PROFILE_SPANS", "").split(",") if s.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_counters: Dict[Key, float] = {}
+_timings: Dict[Key, list] = {}  # key -> [count, sum, max, bucket counts...]
+_profiling = threading.local()
+
+
+def _key(name: str, labels: Dict[str, object]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def incr(name: str, value: float = 1, **labels) -> None:
+    """Adds ``value`` to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Records one duration for a timing."""
+    key = _key(name, labels)
+    index = bisect_left(BUCKETS, seconds)
+    with _lock:
+        timing = _timings.get(key)
+        if timing is None:
+            timing = _timings[key] = [0, 0.0, 0.0] + [0] * len(BUCKETS)
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+        if index < len(BUCKETS):
+            timing[3 + index] += 1
+
+
+@contextmanager
+def span(name: str, **labels) -> Iterator[None]:
+    """Times the enclosed block; failures are counted under ``<name>_errors``.
+
+    Spans listed in PROFILE_SPANS also run under cProfile (unless one is
+    already profiling this thread) and dump their stats to PROFILE_DIR.
+    """
+    profiler = None
+    if (name in PROFILE_SPANS or "all" in PROFILE_SPANS) and not getattr(_profiling, "active", False):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            _profiling.active = True
+        except ValueError:
+            profiler = None  # another profiler is active in this process
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        incr(f"{name}_errors", **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+        if profiler is not None:
+            profiler.disable()
+            _profiling.active = False
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{time.time_ns()}.prof"))
+
+
+def counter_value(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def snapshot() -> Dict[str, Dict]:
+    """All counters and timing summaries as plain JSON-serialisable dicts."""
+    def label(key: Key) -> str:
+        name, labels = key
+        return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+    with _lock:
+        return {
+            "counters": {label(k): v for k, v in _counters.items()},
+            "timings": {
+                label(k): {"count": t[0], "sum_seconds": round(t[1], 6), "max_seconds": round(t[2], 6)}
+                for k, t in _timings.items()
+            },
+        }
+
+
+def render_prometheus() -> str:
+    """Metrics in the Prometheus text exposition format."""
+    def labels_text(labels, extra=()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    with _lock:
+        counters = sorted(_counters.items())
+        timings = sorted(_timings.items())
+
+    lines = []
+    declared = set()
+    for (name, labels), value in counters:
+        metric = f"quiz_{name}_total"
+        if metric not in declared:
+            declared.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{labels_text(labels)} {value:g}")
+    for (name, labels), timing in timings:
+        metric = f"quiz_{name}_seconds"
+        if metric not in declared:
+            declared.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in zip(BUCKETS, timing[3:]):
+            cumulative += count
+            lines.append(f"{metric}_bucket{labels_text(labels, [('le', f'{bound:g}')])} {cumulative}")
+        lines.append(f"{metric}_bucket{labels_text(labels, [('le', '+Inf')])} {timing[0]}")
+        lines.append(f"{metric}_sum{labels_text(labels)} {timing[1]:.6f}")
+        lines.append(f"{metric}_count{labels_text(labels)} {timing[0]}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def _log_forever(path: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": time.time(), **snapshot()}) + "\n")
+
+
+def start_exporters(port: int = METRICS_PORT, log_path: str = METRICS_LOG) -> None:
+    """Starts the /metrics endpoint and the snapshot log, as configured; safe to call repeatedly."""
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    if port:
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.debug(f"✅ Metrics served at http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            logger.debug(f"❌ Metrics endpoint not started: {e}")
+    if log_path:
+        threading.Thread(target=_log_forever, args=(log_path, METRICS_LOG_INTERVAL),
+                         name="metrics-log", daemon=True).start()
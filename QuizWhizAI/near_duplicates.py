@@ -0,0 +1,185 @@
+import argparse
+import os
+import random
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+# Estimated Jaccard similarity above which two questions count as the same; 0 disables
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Operators, numbers and string literals: code questions that differ only in
+# one of these are different questions however similar the rest of the text is
+_CODE_TOKEN_RE = re.compile(r"[=+*/%<>!&|^~@]+|(?<!\w)-|-(?!\w)|\b\d+(?:\.\d+)?\b|'[^']*'|\"[^\"]*\"")
+
+# Fixed seed so signatures are comparable across processes and runs
+_rng = random.Random(1234)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+
+def _normalise(text) -> str:
+    return " ".join(str(text).lower().split())
+
+
+def shingles(question: dict) -> Set[int]:
+    """Hashed character 5-grams over the question, sorted options and answer.
+
+    Only case and whitespace are normalised, so operators and punctuation
+    take part in the comparison.
+    """
+    options = " | ".join(sorted(_normalise(o) for o in question.get("options", []) or []))
+    normalised = _normalise(f"{question.get('question', '')} || {options} || {question.get('answer', '')}")
+    if len(normalised) <= SHINGLE_SIZE:
+        grams = [normalised] if normalised else []
+    else:
+        grams = [normalised[i:i + SHINGLE_SIZE] for i in range(len(normalised) - SHINGLE_SIZE + 1)]
+    return {zlib.crc32(g.encode("utf-8")) for g in grams}
+
+
+def minhash_signature(question: dict) -> Tuple[int, ...]:
+    hashed = shingles(question)
+    if not hashed:
+        return tuple([_MAX_HASH] * NUM_PERM)
+    return tuple(
+        min([(a * x + b) % _MERSENNE_PRIME for x in hashed]) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    )
+
+
+def code_fingerprint(question: dict) -> Tuple[str, Tuple[str, ...]]:
+    """The normalised answer and the operators, numbers and literals of the question.
+
+    Near-duplicates must agree on both: rewording a question keeps them, while
+    ``x //= 3`` and ``x %= 3`` differ in them despite near-identical text.
+    """
+    return (_normalise(question.get("answer", "")),
+            tuple(_CODE_TOKEN_RE.findall(_normalise(question.get("question", "")))))
+
+
+def estimated_similarity(sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+def _band_layout(threshold: float, num_perm: int, min_recall: float = 0.95) -> Tuple[int, int]:
+    """Picks (bands, rows) with ``bands * rows <= num_perm`` for the LSH index.
+
+    A pair with Jaccard similarity s shares a bucket with probability
+    1 - (1 - s^rows)^bands. Uses the most rows per band (fewest false
+    candidates) for which a pair exactly at ``threshold`` still becomes a
+    candidate with probability ``min_recall``; more similar pairs are found
+    even more reliably.
+    """
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= min_recall:
+            return bands, rows
+    return num_perm, 1
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of quiz questions.
+
+    Signatures are split into bands; questions sharing any band bucket become
+    candidates and are confirmed by their estimated Jaccard similarity and an
+    identical ``code_fingerprint``, so a lookup only touches the few questions
+    in matching buckets.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD, num_perm: int = NUM_PERM):
+        self.threshold = threshold
+        self.bands, self.rows = _band_layout(threshold, num_perm)
+        self._buckets: List[Dict[Tuple[int, ...], List[Hashable]]] = [
+            defaultdict(list) for _ in range(self.bands)
+        ]
+        self._signatures: Dict[Hashable, Tuple[int, ...]] = {}
+        self._fingerprints: Dict[Hashable, Tuple[str, Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, key: Hashable, question: dict, signature: Optional[Tuple[int, ...]] = None) -> None:
+        signature = signature or minhash_signature(question)
+        with self._lock:
+            if key in self._signatures:
+                return
+            self._signatures[key] = signature
+            self._fingerprints[key] = code_fingerprint(question)
+            for band, band_key in self._band_keys(signature):
+                self._buckets[band][band_key].append(key)
+
+    def query(self, question: dict, signature: Optional[Tuple[int, ...]] = None) -> List[Tuple[Hashable, float]]:
+        """Returns ``(key, similarity)`` for indexed questions at or above the threshold."""
+        signature = signature or minhash_signature(question)
+        fingerprint = code_fingerprint(question)
+        with self._lock:
+            candidates = set()
+            for band, band_key in self._band_keys(signature):
+                candidates.update(self._buckets[band].get(band_key, ()))
+            matches = [(key, estimated_similarity(signature, self._signatures[key])) for key in candidates
+                       if self._fingerprints[key] == fingerprint]
+        return sorted(((k, s) for k, s in matches if s >= self.threshold), key=lambda m: -m[1])
+
+    def is_near_duplicate(self, question: dict) -> bool:
+        return bool(self.query(question))
+
+
+def dedup_questions(questions: List[dict], threshold: float = NEAR_DUP_THRESHOLD) -> Tuple[List[dict], List[dict]]:
+    """Splits ``questions`` into (kept, dropped), keeping the first of each near-duplicate group."""
+    index = NearDuplicateIndex(threshold)
+    kept, dropped = [], []
+    for i, question in enumerate(questions):
+        signature = minhash_signature(question)
+        if index.query(question, signature):
+            dropped.append(question)
+        else:
+            index.add(i, question, signature)
+            kept.append(question)
+    return kept, dropped
+
+
+def main():
+    # firebase_snapshot imports this module, so its helpers are imported here
+    from firebase_snapshot import SnapshotWriter, iter_snapshot_records
+
+    parser = argparse.ArgumentParser(description="Remove near-duplicate questions from a snapshot.")
+    parser.add_argument("snapshot", help="Path to a questions_snapshot.json or .jsonl file")
+    parser.add_argument("--threshold", type=float, default=NEAR_DUP_THRESHOLD or 0.8)
+    parser.add_argument("--output", help="Where to write the deduplicated snapshot (default: dry run)")
+    args = parser.parse_args()
+
+    # Records are streamed; only their signatures and fingerprints are kept in memory
+    index = NearDuplicateIndex(args.threshold)
+    writer = SnapshotWriter(args.output) if args.output else None
+    total = dropped = 0
+    for total, question in enumerate(iter_snapshot_records(args.snapshot), start=1):
+        signature = minhash_signature(question)
+        if index.query(question, signature):
+            dropped += 1
+            print(f"🗑️ {question.get('question', '')[:100]}")
+            continue
+        index.add(total, question, signature)
+        if writer:
+            writer.write(question)
+    print(f"Kept {total - dropped} of {total} questions ({dropped} near-duplicates)")
+
+    if writer:
+        writer.close()
+        print(f"Wrote {writer.count} questions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from os import getenv
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import (
+    APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, OpenAI, OpenAIError,
+    RateLimitError
+)
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Per-attempt timeout and overall deadline for one completion, in seconds
+OPENAI_TIMEOUT = float(getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_DEADLINE = float(getenv("OPENAI_DEADLINE", "60"))
+OPENAI_MAX_RETRIES = int(getenv("OPENAI_MAX_RETRIES", "3"))
+# Completions in flight at once across the whole process
+OPENAI_MAX_CONCURRENCY = int(getenv("OPENAI_MAX_CONCURRENCY", "8"))
+# Keep-alive pool size of the shared HTTP client
+OPENAI_MAX_CONNECTIONS = int(getenv("OPENAI_MAX_CONNECTIONS", "16"))
+
+_BACKOFF_BASE = 0.5
+_BACKOFF_CAP = 8.0
+_RETRYABLE = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+_clients: Dict[str, OpenAI] = {}
+_clients_lock = threading.Lock()
+_in_flight = threading.BoundedSemaphore(OPENAI_MAX_CONCURRENCY)
+
+# Async clients and semaphores are bound to the event loop that created them
+_async_state: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_openai_client(api_key: str) -> OpenAI:
+    """Returns the process-wide client for ``api_key``, reusing pooled connections.
+
+    Retries are handled by ``create_chat_completion`` so the SDK's own retry
+    loop is turned off.
+    """
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5.0),
+            )
+            client = OpenAI(api_key=api_key, http_client=http_client, max_retries=0,
+                            timeout=OPENAI_TIMEOUT)
+            _clients[api_key] = client
+        return client
+
+
+def _record_usage(response) -> None:
+    usage = getattr(response, "usage", None)
+    metrics.incr("openai_requests")
+    if usage is not None:
+        metrics.incr("openai_tokens", usage.prompt_tokens or 0, kind="prompt")
+        metrics.incr("openai_tokens", usage.completion_tokens or 0, kind="completion")
+
+
+def get_usage_totals() -> Dict[str, int]:
+    """Completions and tokens reported by the API across this process."""
+    return {
+        "requests": int(metrics.counter_value("openai_requests")),
+        "prompt_tokens": int(metrics.counter_value("openai_tokens", kind="prompt")),
+        "completion_tokens": int(metrics.counter_value("openai_tokens", kind="completion")),
+    }
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: Optional[Exception] = None) -> float:
+    """Full-jitter exponential backoff, honouring Retry-After when the API sends it."""
+    delay = random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * 2 ** attempt))
+    hinted = _retry_after(error) if error is not None else None
+    return max(delay, hinted) if hinted is not None else delay
+
+
+def create_chat_completion(api_key: str, deadline: float = OPENAI_DEADLINE, **kwargs):
+    """Creates a chat completion through the shared client.
+
+    Each attempt holds one slot of the global in-flight semaphore and is bounded
+    by what is left of ``deadline``; rate limits, timeouts, connection errors
+    and 5xx responses are retried with jittered backoff.
+    """
+    client = get_openai_client(api_key)
+    expires = time.monotonic() + deadline
+    last_error: Optional[Exception] = None
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        remaining = expires - time.monotonic()
+        if remaining <= 0 or not _in_flight.acquire(timeout=remaining):
+            break
+        try:
+            remaining = expires - time.monotonic()
+            with metrics.span("openai_request"):
+                response = client.chat.completions.create(timeout=min(OPENAI_TIMEOUT, max(remaining, 0.1)),
+                                                          **kwargs)
+            _record_usage(response)
+            return response
+        except _RETRYABLE as e:
+            last_error = e
+            metrics.incr("openai_retryable_errors", error=type(e).__name__)
+            logger.debug(f"⚠️ OpenAI attempt {attempt + 1} failed: {e}")
+        finally:
+            _in_flight.release()
+
+        if attempt < OPENAI_MAX_RETRIES:
+            delay = backoff_delay(attempt, last_error)
+            if time.monotonic() + delay >= expires:
+                break
+            metrics.incr("openai_retries")
+            time.sleep(delay)
+
+    if last_error is not None:
+        raise last_error
+    raise OpenAIError(f"OpenAI request did not complete within {deadline:.0f}s")
+
+
+def _loop_state() -> Tuple[Dict[str, AsyncOpenAI], asyncio.Semaphore]:
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        state = _async_state.get(loop)
+        if state is None:
+            state = _async_state[loop] = ({}, asyncio.Semaphore(OPENAI_MAX_CONCURRENCY))
+        return state
+
+
+def get_async_openai_client(api_key: str) -> AsyncOpenAI:
+    """Returns the running event loop's pooled async client for ``api_key``."""
+    clients, _ = _loop_state()
+    client = clients.get(api_key)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5.0),
+        )
+        client = clients[api_key] = AsyncOpenAI(api_key=api_key, http_client=http_client,
+                                                max_retries=0, timeout=OPENAI_TIMEOUT)
+    return client
+
+
+async def acreate_chat_completion(api_key: str, deadline: float = OPENAI_DEADLINE, **kwargs):
+    """Asyncio counterpart of create_chat_completion.
+
+    The in-flight cap is enforced per event loop with an asyncio semaphore of
+    the same OPENAI_MAX_CONCURRENCY size.
+    """
+    client = get_async_openai_client(api_key)
+    _, semaphore = _loop_state()
+    loop = asyncio.get_running_loop()
+    expires = loop.time() + deadline
+    last_error: Optional[Exception] = None
+
+    async def attempt_once():
+        async with semaphore:
+            return await client.chat.completions.create(
+                timeout=min(OPENAI_TIMEOUT, max(expires - loop.time(), 0.1)), **kwargs)
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        remaining = expires - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            with metrics.span("openai_request"):
+                response = await asyncio.wait_for(attempt_once(), timeout=remaining)
+            _record_usage(response)
+            return response
+        except _RETRYABLE as e:
+            last_error = e
+            metrics.incr("openai_retryable_errors", error=type(e).__name__)
+            logger.debug(f"⚠️ OpenAI attempt {attempt + 1} failed: {e}")
+        except asyncio.TimeoutError:
+            break
+
+        if attempt < OPENAI_MAX_RETRIES:
+            delay = backoff_delay(attempt, last_error)
+            if loop.time() + delay >= expires:
+                break
+            metrics.incr("openai_retries")
+            await asyncio.sleep(delay)
+
+    if last_error is not None:
+        raise last_error
+    raise OpenAIError(f"OpenAI request did not complete within {deadline:.0f}s")
@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Sequence, Set
+
+import metrics
+from create_context_from_PDF import CACHE_DIR
+from question_hash import question_hash
+from rank_context_chunks import chunks_key
+
+logger = logging.getLogger(__name__)
+
+# Set QUESTION_CACHE=0 to always generate fresh questions
+QUESTION_CACHE_ENABLED = os.getenv("QUESTION_CACHE", "1") == "1"
+QUESTION_CACHE_PATH = os.getenv("QUESTION_CACHE_PATH", os.path.join(CACHE_DIR, "questions.db"))
+# Generated questions expire after this many seconds (default one week)
+QUESTION_CACHE_TTL = float(os.getenv("QUESTION_CACHE_TTL", str(7 * 24 * 3600)))
+# Questions kept per (model, topic, study material, template) key, and in the whole cache
+QUESTION_CACHE_POOL_SIZE = int(os.getenv("QUESTION_CACHE_POOL_SIZE", "50"))
+QUESTION_CACHE_MAX_ROWS = int(os.getenv("QUESTION_CACHE_MAX_ROWS", "20000"))
+# Sessions whose served questions are remembered at once
+QUESTION_CACHE_MAX_SESSIONS = int(os.getenv("QUESTION_CACHE_MAX_SESSIONS", "256"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generated_questions (
+    model            TEXT NOT NULL,
+    topic            TEXT NOT NULL,
+    chunk_hash       TEXT NOT NULL,  -- chunks_key of the topic's context chunks
+    template_version INTEGER NOT NULL,
+    id               TEXT NOT NULL,
+    question         TEXT NOT NULL,
+    created_at       REAL NOT NULL,
+    PRIMARY KEY (model, topic, template_version, chunk_hash, id)
+);
+CREATE INDEX IF NOT EXISTS idx_generated_questions_created ON generated_questions (created_at);
+"""
+
+
+class QuestionCache:
+    """Persistent pool of validated generated questions.
+
+    Questions are stored under (model, topic, hash of the topic's chunk set,
+    prompt template version), expire after ``ttl`` seconds and are capped per
+    key and in total, oldest first. The key covers the whole chunk set rather
+    than the chunks a prompt happened to use, so each topic has one pool that
+    is dropped from serving as soon as its study material changes. ``take``
+    serves a session only questions it has not been served before.
+    """
+
+    def __init__(self, path: str, ttl: float = QUESTION_CACHE_TTL,
+                 pool_size: int = QUESTION_CACHE_POOL_SIZE, max_rows: int = QUESTION_CACHE_MAX_ROWS,
+                 max_sessions: int = QUESTION_CACHE_MAX_SESSIONS):
+        self.path = path
+        self.ttl = ttl
+        self.pool_size = pool_size
+        self.max_rows = max_rows
+        self.max_sessions = max_sessions
+        self._conn = None
+        self._conn_lock = threading.RLock()
+        self._served: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self._served_lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Holds the cache's one connection, shared by all threads (Streamlit
+        reruns each get a new thread)."""
+        with self._conn_lock:
+            if self._conn is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                self._conn = conn
+            yield self._conn
+
+    def served(self, session_id: str) -> Set[str]:
+        with self._served_lock:
+            ids = self._served.get(session_id)
+            if ids is None:
+                ids = self._served[session_id] = set()
+                while len(self._served) > self.max_sessions:
+                    self._served.popitem(last=False)
+            self._served.move_to_end(session_id)
+            return ids
+
+    def mark_served(self, session_id: str, questions: Iterable[Dict]) -> None:
+        ids = self.served(session_id)
+        with self._served_lock:
+            ids.update(question_hash(q) for q in questions)
+
+    def take(self, model: str, topic: str, template_version: int, context_chunks: Sequence[str],
+             session_id: str, limit: int) -> List[Dict]:
+        """Up to ``limit`` unexpired questions for ``topic`` and its current study
+        material that this session has not been served."""
+        if limit <= 0:
+            return []
+        served = self.served(session_id)
+        with self._served_lock:
+            exclude = set(served)
+        try:
+            with self._connection() as conn:
+                rows = conn.execute(
+                    "SELECT id, question FROM generated_questions "
+                    "WHERE model = ? AND topic = ? AND template_version = ? AND chunk_hash = ? "
+                    "AND created_at >= ? ORDER BY random() LIMIT ?",
+                    (model, topic, template_version, chunks_key(context_chunks),
+                     time.time() - self.ttl, limit + len(exclude)),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.debug(f"❌ Question cache read failed: {e}")
+            return []
+
+        questions = [json.loads(question) for id_, question in rows if id_ not in exclude][:limit]
+        self.mark_served(session_id, questions)
+        return questions
+
+    def add(self, model: str, topic: str, template_version: int, context_chunks: Sequence[str],
+            questions: List[Dict]) -> None:
+        if not questions:
+            return
+        key = (model, topic, template_version, chunks_key(context_chunks))
+        now = time.time()
+        rows = [(*key, question_hash(q), json.dumps(q, ensure_ascii=False), now) for q in questions]
+        try:
+            with self._connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO generated_questions "
+                        "(model, topic, template_version, chunk_hash, id, question, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                    # Keep only the newest pool_size questions for this key
+                    conn.execute(
+                        "DELETE FROM generated_questions WHERE model = ? AND topic = ? AND template_version = ? "
+                        "AND chunk_hash = ? AND id NOT IN (SELECT id FROM generated_questions "
+                        "WHERE model = ? AND topic = ? AND template_version = ? AND chunk_hash = ? "
+                        "ORDER BY created_at DESC LIMIT ?)", (*key, *key, self.pool_size))
+                    if now - self._last_sweep > 60:
+                        self._last_sweep = now
+                        self._sweep(conn, now)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logger.debug(f"❌ Question cache write failed: {e}")
+
+    def _sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drops expired questions, then the oldest ones beyond max_rows."""
+        conn.execute("DELETE FROM generated_questions WHERE created_at < ?", (now - self.ttl,))
+        excess = conn.execute("SELECT COUNT(*) FROM generated_questions").fetchone()[0] - self.max_rows
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM generated_questions WHERE rowid IN "
+                "(SELECT rowid FROM generated_questions ORDER BY created_at LIMIT ?)", (excess,))
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM generated_questions")
+        with self._served_lock:
+            self._served.clear()
+
+
+_CACHE = QuestionCache(QUESTION_CACHE_PATH) if QUESTION_CACHE_ENABLED else None
+
+
+def get_question_cache():
+    """The process-wide question cache, or None when QUESTION_CACHE=0."""
+    return _CACHE
+
+
+def record_lookup(hits: int, misses: int) -> None:
+    metrics.incr("cache_hits", hits, cache="questions")
+    metrics.incr("cache_misses", misses, cache="questions")
@@ -0,0 +1,17 @@
+import hashlib
+import json
+
+
+def question_hash(question: dict) -> str:
+    """Canonical content hash of a quiz question.
+
+    Covers the question text, the answer and the set of options (order-free), so
+    two questions hash equally exactly when ``are_questions_identical`` holds.
+    """
+    canonical = [
+        question.get("question"),
+        question.get("answer"),
+        sorted(set(question.get("options", []))),
+    ]
+    payload = json.dumps(canonical, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
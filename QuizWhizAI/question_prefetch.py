@@ -0,0 +1,115 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from os import getenv
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Questions kept ready (or in flight) ahead of the one being answered
+PREFETCH_DEPTH = int(getenv("PREFETCH_DEPTH", "5"))
+# Questions requested per chat completion
+PREFETCH_BATCH_SIZE = int(getenv("PREFETCH_BATCH_SIZE", "5"))
+# Background generations running at once across all sessions
+PREFETCH_WORKERS = int(getenv("PREFETCH_WORKERS", "4"))
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="quiz-prefetch")
+
+
+class QuestionPrefetcher:
+    """Bounded per-quiz buffer of questions generated on a background pool.
+
+    The first question is requested on its own so the quiz can start after a
+    single-question completion; later questions are requested in batches of
+    up to ``batch_size``. At most
+    ``depth`` questions are buffered or in flight at any time, and no more than
+    ``budget`` questions are ever requested, so a quiz never pays for more
+    questions than it can show. ``close()`` cancels queued generations when the
+    quiz is abandoned; a generation that is already running finishes but its
+    result is dropped.
+    """
+
+    def __init__(self, topic: str, generate: Callable[[int], List[Dict]], budget: int,
+                 depth: int = PREFETCH_DEPTH, batch_size: int = PREFETCH_BATCH_SIZE):
+        self.topic = topic
+        self.batch_size = max(1, batch_size)
+        self.depth = max(self.batch_size, depth)
+        self._generate = generate
+        self._remaining = budget
+        self._ready: Deque[Dict] = deque()
+        # (future, number of questions requested) in the order they will be served
+        self._queue: Deque[Tuple[Future, int]] = deque()
+        self._in_flight = 0
+        self._requests = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._fill()
+
+    def _fill(self) -> None:
+        with self._lock:
+            while not self._closed and self._remaining > 0:
+                room = self.depth - len(self._ready) - self._in_flight
+                n = min(self.batch_size, self._remaining)
+                if self._requests == 0:
+                    n = 1
+                elif self._requests == 1:
+                    # Fill the rest of the buffer alongside the first question
+                    n = min(n, room)
+                if n <= 0 or n > room:
+                    break
+                self._requests += 1
+                self._remaining -= n
+                self._in_flight += n
+                self._queue.append((_EXECUTOR.submit(self._generate, n), n))
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Returns the next question, waiting for it if it is still being generated.
+
+        Returns None if the generation failed or timed out, the budget is
+        exhausted or the prefetcher has been closed.
+        """
+        with self._lock:
+            if self._ready:
+                question = self._ready.popleft()
+                waiting_on = None
+            elif self._queue:
+                waiting_on, requested = self._queue.popleft()
+            else:
+                return None
+
+        if waiting_on is not None:
+            try:
+                batch = waiting_on.result(timeout=timeout) or []
+            except TimeoutError:
+                with self._lock:
+                    self._queue.appendleft((waiting_on, requested))
+                return None
+            except Exception as e:
+                logger.debug(f"❌ Prefetch failed for {self.topic}: {e}")
+                batch = []
+
+            with self._lock:
+                self._in_flight -= requested
+                # Questions the batch failed to deliver do not count against the budget
+                self._remaining += max(0, requested - len(batch))
+                if not self._closed:
+                    self._ready.extend(batch[:requested])
+                question = self._ready.popleft() if self._ready else None
+
+        self._fill()
+        return question
+
+    def ready_count(self) -> int:
+        with self._lock:
+            return len(self._ready)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            pending = [future for future, _ in self._queue]
+            self._queue.clear()
+            self._ready.clear()
+            self._in_flight = 0
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from create_context_from_PDF import CACHE_DIR
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Chunks shorter than this (title pages, page furniture) are never sampled
+MIN_CHUNK_CHARS = 200
+
+_TOKEN_RE = re.compile(r"[a-z_][a-z0-9_]+")
+_STOP_WORDS = frozenset(
+    "the and for are but not you all any can her was one our out has have had "
+    "this that with from they will would there their what which when who how "
+    "into than then them these those its also each such may use used using".split()
+)
+_CHAPTER_PREFIX_RE = re.compile(r"^chapter\s*\d+\s*", re.IGNORECASE)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOP_WORDS]
+
+
+# Recently hashed chunk sequences, so repeated picks on the shared tuple skip rehashing
+_KEY_MEMO: "OrderedDict[int, Tuple[Sequence[str], str]]" = OrderedDict()
+_KEY_MEMO_SIZE = 16
+_KEY_LOCK = threading.Lock()
+
+
+def chunks_key(chunks: Sequence[str]) -> str:
+    memo = _KEY_MEMO.get(id(chunks))
+    if memo is not None and memo[0] is chunks:
+        return memo[1]
+
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8"))
+        digest.update(b"\0")
+    key = digest.hexdigest()
+
+    if isinstance(chunks, tuple):
+        with _KEY_LOCK:
+            _KEY_MEMO[id(chunks)] = (chunks, key)
+            while len(_KEY_MEMO) > _KEY_MEMO_SIZE:
+                _KEY_MEMO.popitem(last=False)
+    return key
+
+
+class ChunkIndex:
+    """BM25 index over the chunks of one chapter, stored as inverted postings."""
+
+    def __init__(self, postings: Dict[str, List[Tuple[int, int]]], doc_lengths: List[int]):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        n = len(doc_lengths)
+        avg_len = (sum(doc_lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in postings.items()
+        }
+        # Per-document length normalisation, precomputed once
+        self._norm = [K1 * (1 - B + B * (dl / avg_len)) if avg_len else K1 for dl in doc_lengths]
+
+    @classmethod
+    def build(cls, chunks: Sequence[str]) -> "ChunkIndex":
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        doc_lengths = []
+        for idx, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((idx, tf))
+        return cls(dict(postings), doc_lengths)
+
+    def scores(self, query: str) -> List[float]:
+        scores = [0.0] * len(self.doc_lengths)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for idx, tf in self.postings[term]:
+                scores[idx] += idf * tf * (K1 + 1) / (tf + self._norm[idx])
+        return scores
+
+    def top_k(self, query: str, k: int = 5) -> List[int]:
+        scores = self.scores(query)
+        ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+        return [i for i in ranked[:k] if scores[i] > 0]
+
+    def to_json(self) -> dict:
+        return {"postings": self.postings, "doc_lengths": self.doc_lengths}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ChunkIndex":
+        postings = {term: [tuple(p) for p in plist] for term, plist in data["postings"].items()}
+        return cls(postings, data["doc_lengths"])
+
+
+_INDEXES: Dict[str, ChunkIndex] = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def _index_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.bm25.json")
+
+
+def get_chunk_index(chunks: Sequence[str], key: Optional[str] = None) -> ChunkIndex:
+    """Returns the BM25 index for ``chunks``, building and persisting it once."""
+    key = key or chunks_key(chunks)
+    with _INDEX_LOCK:
+        index = _INDEXES.get(key)
+        if index is not None:
+            return index
+
+        path = _index_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = ChunkIndex.from_json(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring unreadable chunk index {path}: {e}")
+
+        if index is None or len(index.doc_lengths) != len(chunks):
+            index = ChunkIndex.build(chunks)
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(index.to_json(), f, separators=(",", ":"))
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"⚠️ Could not write chunk index {path}: {e}")
+
+        _INDEXES[key] = index
+        return index
+
+
+class ChunkSampler:
+    """Spreads generations across a chapter.
+
+    Each call picks among the least-used eligible chunks, weighting the
+    candidates by their BM25 relevance to the topic so on-topic passages are
+    preferred while the whole chapter still gets covered.
+    """
+
+    def __init__(self):
+        self._usage: Dict[str, List[int]] = {}
+        self._eligible: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def pick(self, topic: str, chunks: Sequence[str], query: Optional[str] = None) -> int:
+        chunks_hash = chunks_key(chunks)
+        index = get_chunk_index(chunks, chunks_hash)
+        relevance = index.scores(query if query is not None else topic_query(topic))
+        key = f"{topic}:{chunks_hash}"
+
+        with self._lock:
+            usage = self._usage.get(key)
+            if usage is None:
+                usage = self._usage[key] = [0] * len(chunks)
+                eligible = [i for i, c in enumerate(chunks) if len(c) >= MIN_CHUNK_CHARS]
+                self._eligible[key] = eligible or list(range(len(chunks)))
+            eligible = self._eligible[key]
+            least = min(usage[i] for i in eligible)
+            candidates = [i for i in eligible if usage[i] == least]
+            choice = random.choices(candidates, weights=[1.0 + relevance[i] for i in candidates])[0]
+            usage[choice] += 1
+            return choice
+
+    def reset(self, topic: Optional[str] = None) -> None:
+        with self._lock:
+            if topic is None:
+                self._usage.clear()
+                self._eligible.clear()
+            else:
+                for key in [k for k in self._usage if k.startswith(f"{topic}:")]:
+                    del self._usage[key]
+                    del self._eligible[key]
+
+
+_SAMPLER = ChunkSampler()
+
+
+def topic_query(topic: str) -> str:
+    """Turns a chapter title such as "Chapter05 Functions" into a search query."""
+    return _CHAPTER_PREFIX_RE.sub("", topic)
+
+
+def select_context_chunk(topic: str, context_chunks: Sequence[str], query: Optional[str] = None) -> str:
+    """Returns the next study-material chunk to ground a question on."""
+    if not context_chunks:
+        return ""
+    return context_chunks[_SAMPLER.pick(topic, context_chunks, query)]
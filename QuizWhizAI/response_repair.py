@@ -0,0 +1,105 @@
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+import metrics
+
+_FENCE = re.compile(r"```[a-zA-Z0-9_-]*\s*\n?(.*?)```", re.DOTALL)
+# "B) text", "b. text", "(c) text", "Option D: text"
+_OPTION_LABEL = re.compile(r"^\s*(?:option\s+)?\(?([a-hA-H])[).:]\s*", re.IGNORECASE)
+_QUOTES = str.maketrans({"'": '"', "`": '"', "\u2018": '"', "\u2019": '"', "\u201c": '"', "\u201d": '"'})
+
+
+def strip_code_fences(text: str) -> str:
+    """Returns the contents of the first fenced block, or the text unchanged."""
+    match = _FENCE.search(text)
+    return match.group(1).strip() if match else text.strip()
+
+
+def extract_json(text: str) -> Tuple[Any, List[str]]:
+    """Parses the JSON value in a reply that may be fenced or surrounded by prose.
+
+    Returns the value and the repairs that were needed to get it; raises
+    json.JSONDecodeError when no JSON object or array can be found.
+    """
+    try:
+        return json.loads(text), []
+    except json.JSONDecodeError as e:
+        error = e
+
+    repairs = []
+    unfenced = strip_code_fences(text)
+    if unfenced != text.strip():
+        repairs.append("fences")
+        try:
+            return json.loads(unfenced), repairs
+        except json.JSONDecodeError as e:
+            error = e
+
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"[{\[]", unfenced):
+        try:
+            value, _ = decoder.raw_decode(unfenced, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, (dict, list)) and value:
+            return value, repairs + ["extracted_json"]
+    raise error
+
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text).split()).strip(" .").casefold()
+
+
+def _loose(text: str) -> str:
+    """Ignores all whitespace, case and the kind of quotes, nothing else."""
+    return "".join(_normalize(text).translate(_QUOTES).split())
+
+
+def match_answer(answer: str, options: List[str]) -> Optional[str]:
+    """Maps ``answer`` onto one of ``options``; None when no option is a confident match.
+
+    Tries, in order: an exact match, a match ignoring case and whitespace, a
+    bare option letter ("B"), the answer with an option label stripped, and a
+    match ignoring all whitespace and quote style. Answers that differ from
+    every option in any other way (``[1, 2, 3]`` vs ``[1, 2, 4]``) are not
+    matched, so the reply goes to the repair retry instead.
+    """
+    if answer in options:
+        return answer
+    normalized = {_normalize(option): option for option in options}
+    if _normalize(answer) in normalized:
+        return normalized[_normalize(answer)]
+
+    letter = answer.strip().strip("().:").upper()
+    if len(letter) == 1 and "A" <= letter < chr(ord("A") + len(options)):
+        return options[ord(letter) - ord("A")]
+
+    unlabeled = _normalize(_OPTION_LABEL.sub("", answer))
+    if unlabeled in normalized:
+        return normalized[unlabeled]
+    unlabeled_options = {_normalize(_OPTION_LABEL.sub("", o)): o for o in options}
+    if unlabeled in unlabeled_options:
+        return unlabeled_options[unlabeled]
+
+    loose = [o for key, o in unlabeled_options.items() if _loose(key) == _loose(unlabeled)]
+    return loose[0] if len(loose) == 1 else None
+
+
+def repair_question(data: Any) -> Tuple[Any, List[str]]:
+    """Fixes an ``answer`` that is not literally one of the ``options``."""
+    if not isinstance(data, dict):
+        return data, []
+    options = data.get("options")
+    answer = data.get("answer")
+    if not isinstance(options, list) or not isinstance(answer, str) or answer in options:
+        return data, []
+    matched = match_answer(answer, [str(o) for o in options])
+    if matched is None:
+        return data, []
+    return {**data, "answer": matched}, ["answer_matched"]
+
+
+def record_repairs(repairs: List[str]) -> None:
+    for kind in repairs:
+        metrics.incr("repairs", kind=kind)
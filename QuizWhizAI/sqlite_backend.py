@@ -0,0 +1,210 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from near_duplicates import NEAR_DUP_THRESHOLD, NearDuplicateIndex
+from question_hash import question_hash
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PATH = os.getenv(
+    "SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.db"),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quiz_questions (
+    content_hash TEXT PRIMARY KEY,
+    topic        TEXT NOT NULL,
+    question     TEXT NOT NULL,
+    options      TEXT NOT NULL,
+    answer       TEXT NOT NULL,
+    explanation  TEXT NOT NULL DEFAULT '',
+    random_key   REAL NOT NULL,
+    created_at   REAL NOT NULL DEFAULT (strftime('%s', 'now'))
+);
+CREATE INDEX IF NOT EXISTS idx_quiz_questions_topic_random ON quiz_questions (topic, random_key);
+CREATE INDEX IF NOT EXISTS idx_quiz_questions_random ON quiz_questions (random_key);
+"""
+
+_INSERT = """
+INSERT OR IGNORE INTO quiz_questions
+    (content_hash, topic, question, options, answer, explanation, random_key)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# One connection per database file, shared by every thread of the process.
+# Streamlit runs each rerun on a new thread, so per-thread connections would
+# be reopened on nearly every rerun; the lock serialises use of the shared one.
+_connections: Dict[str, sqlite3.Connection] = {}
+_lock = threading.RLock()
+
+# Near-duplicate index of the questions this process has saved
+_NEAR_DUPLICATES = NearDuplicateIndex(NEAR_DUP_THRESHOLD) if NEAR_DUP_THRESHOLD > 0 else None
+
+
+@contextmanager
+def _connection(path: str = None) -> Iterator[sqlite3.Connection]:
+    """Holds the process-wide connection to ``path`` (default SQLITE_PATH)."""
+    path = path or SQLITE_PATH
+    with _lock:
+        conn = _connections.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.executescript(_SCHEMA)
+            _connections[path] = conn
+        yield conn
+
+
+def _row(topic: str, question_data: dict) -> tuple:
+    return (
+        question_hash(question_data),
+        topic or question_data.get("topic", ""),
+        question_data["question"],
+        json.dumps(list(question_data["options"]), ensure_ascii=False),
+        question_data["answer"],
+        question_data.get("explanation", ""),
+        random.random(),
+    )
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def initialize_firebase(credential_path: str):
+    """Opens the database and creates the schema; the credential path is unused."""
+    with _connection():
+        pass
+    logger.debug(f"✅ SQLite store ready at {SQLITE_PATH}.")
+
+
+def are_questions_identical(q1: dict, q2: dict) -> bool:
+    return (
+            q1.get("question") == q2.get("question")
+            and q1.get("answer") == q2.get("answer")
+            and set(q1.get("options", [])) == set(q2.get("options", []))
+    )
+
+
+def is_duplicate_question(new_question: dict) -> bool:
+    """Primary-key lookup on content_hash, then the near-duplicate index."""
+    if _NEAR_DUPLICATES is not None and _NEAR_DUPLICATES.is_near_duplicate(new_question):
+        return True
+    try:
+        with _connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM quiz_questions WHERE content_hash = ?", (question_hash(new_question),)
+            ).fetchone()
+        return row is not None
+    except sqlite3.Error as e:
+        logger.debug(f"❌ Error checking duplicates: {e}")
+        return False
+
+
+def save_quiz_question(topic: str, question_data: dict) -> str:
+    """Saves a question under its content hash, so saving it twice is idempotent."""
+    hashes = save_quiz_questions(topic, [question_data])
+    return hashes[0] if hashes else ""
+
+
+def save_quiz_questions(topic: str, questions: Iterable[dict]) -> List[str]:
+    """Inserts many questions in a single transaction and returns their content hashes.
+
+    Questions missing a required field are skipped; each question's own topic
+    is used when ``topic`` is empty.
+    """
+    rows, saved = [], []
+    for question in questions:
+        try:
+            rows.append(_row(topic, question))
+            saved.append(question)
+        except (KeyError, TypeError) as e:
+            logger.debug(f"❌ Skipping malformed question: {e}")
+    try:
+        with _connection() as conn, _transaction(conn):
+            conn.executemany(_INSERT, rows)
+    except sqlite3.Error as e:
+        logger.debug(f"❌ Failed to save questions: {e}")
+        return []
+    if _NEAR_DUPLICATES is not None:
+        for row, question in zip(rows, saved):
+            _NEAR_DUPLICATES.add(row[0], question)
+    return [row[0] for row in rows]
+
+
+def get_random_quiz_questions(limit=10, topic: Optional[str] = None,
+                              exclude_ids: Optional[Iterable[str]] = None) -> list:
+    """Samples ``limit`` questions by seeking to a random point of the random_key index,
+    wrapping around to the start when the point is near the end."""
+    exclude_ids = set(exclude_ids or ())
+    fetch = limit + min(len(exclude_ids), limit)
+    where, params = ("topic = ? AND ", [topic]) if topic else ("", [])
+    sql = (f"SELECT content_hash, topic, question, options, answer, explanation FROM quiz_questions "
+           f"WHERE {where}random_key {{}} ? ORDER BY random_key LIMIT ?")
+    try:
+        pivot = random.random()
+        with _connection() as conn:
+            rows = conn.execute(sql.format(">="), (*params, pivot, fetch)).fetchall()
+            if len(rows) < fetch:
+                rows += conn.execute(sql.format("<"), (*params, pivot, fetch - len(rows))).fetchall()
+    except sqlite3.Error as e:
+        logger.debug(f"❌ Failed to retrieve questions: {e}")
+        return []
+
+    questions = [
+        {"id": content_hash, "topic": topic_, "question": question, "options": json.loads(options),
+         "answer": answer, "explanation": explanation}
+        for content_hash, topic_, question, options, answer, explanation in rows
+        if content_hash not in exclude_ids
+    ]
+    random.shuffle(questions)
+    return questions[:limit]
+
+
+def get_quiz_question_count() -> int:
+    try:
+        with _connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM quiz_questions").fetchone()[0]
+    except sqlite3.Error as e:
+        logger.debug(f"❌ Failed to count quiz questions: {e}")
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a question snapshot into the SQLite store.")
+    parser.add_argument("snapshot", help="JSON array or JSON Lines snapshot")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from firebase_snapshot import iter_snapshot_records
+
+    before = get_quiz_question_count()
+    batch = []
+    for record in iter_snapshot_records(args.snapshot):
+        batch.append(record)
+        if len(batch) >= args.batch_size:
+            save_quiz_questions("", batch)
+            batch = []
+    save_quiz_questions("", batch)
+    print(f"Imported {get_quiz_question_count() - before} new questions into {SQLITE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Latency budgets for a full script execution of main.py, in milliseconds
+FIRST_RENDER_BUDGET_MS = float(os.getenv("FIRST_RENDER_BUDGET_MS", "3000"))
+RERUN_BUDGET_MS = float(os.getenv("RERUN_BUDGET_MS", "150"))
+
+# Modules main.py imports at startup, heaviest third-party ones first
+STARTUP_MODULES = [
+    "streamlit", "fitz", "openai", "pydantic", "fpdf", "firebase_admin",
+    "create_context_from_PDF", "get_quiz", "export_quiz_to_PDF", "storage_backend",
+]
+
+_runs: Dict[str, List[float]] = {"first": [], "rerun": []}
+_runs_lock = threading.Lock()
+
+
+def record_script_run(seconds: float) -> None:
+    """Records one completed script execution and warns when it is over budget."""
+    ms = seconds * 1000
+    with _runs_lock:
+        kind = "rerun" if _runs["first"] else "first"
+        _runs[kind].append(ms)
+    metrics.observe("script_run", seconds, kind=kind)
+    budget = FIRST_RENDER_BUDGET_MS if kind == "first" else RERUN_BUDGET_MS
+    if ms > budget:
+        logger.warning(f"⚠️ {kind} script run took {ms:.0f} ms (budget {budget:.0f} ms)")
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+def script_run_stats() -> Dict[str, Dict[str, float]]:
+    with _runs_lock:
+        return {kind: _summary(values) for kind, values in _runs.items()}
+
+
+def measure_import_times(modules: List[str]) -> Dict[str, float]:
+    """Import time of each module in a fresh interpreter, in milliseconds."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = {}
+    for module in modules:
+        code = (
+            "import sys, time; sys.path.insert(0, %r); t = time.perf_counter(); "
+            "import %s; print((time.perf_counter() - t) * 1000)" % (here, module)
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=here)
+        try:
+            times[module] = round(float(result.stdout.strip().splitlines()[-1]), 1)
+        except (ValueError, IndexError):
+            times[module] = None
+    return times
+
+
+def measure_script_runs(reruns: int) -> Dict[str, Dict[str, float]]:
+    """Runs main.py headlessly once plus ``reruns`` times and times every execution."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"),
+                            default_timeout=60)
+    timings = {"first": [], "rerun": []}
+    for i in range(reruns + 1):
+        started = time.perf_counter()
+        app.run()
+        timings["first" if i == 0 else "rerun"].append((time.perf_counter() - started) * 1000)
+        if app.exception:
+            raise RuntimeError(f"main.py raised: {app.exception[0].value}")
+    return {kind: _summary(values) for kind, values in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time and script-run latency of main.py.")
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    report = {
+        "import_ms": measure_import_times(STARTUP_MODULES),
+        "script_runs": measure_script_runs(args.reruns),
+        "budgets_ms": {"first": FIRST_RENDER_BUDGET_MS, "rerun": RERUN_BUDGET_MS},
+    }
+    print(json.dumps(report, indent=2))
+
+    over_budget = [
+        kind for kind, budget in (("first", FIRST_RENDER_BUDGET_MS), ("rerun", RERUN_BUDGET_MS))
+        if report["script_runs"][kind].get("p95_ms", 0) > budget
+    ]
+    if over_budget:
+        print(f"❌ Over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import functools
+import importlib
+import os
+from typing import Callable, Iterable, List, Optional, Protocol
+
+import metrics
+
+# Which question store the app uses: firestore, snapshot or sqlite
+QUIZ_BACKEND = os.getenv("QUIZ_BACKEND", "firestore").lower()
+
+BACKEND_MODULES = {
+    "firestore": "firebase_backend",
+    "snapshot": "firebase_snapshot",
+    "sqlite": "sqlite_backend",
+}
+
+
+class StorageBackend(Protocol):
+    """Functions every question store module provides."""
+
+    def initialize_firebase(self, credential_path: str) -> None: ...
+
+    def is_duplicate_question(self, new_question: dict) -> bool: ...
+
+    def save_quiz_question(self, topic: str, question_data: dict) -> str: ...
+
+    def save_quiz_questions(self, topic: str, questions: Iterable[dict]) -> List[str]: ...
+
+    def get_random_quiz_questions(self, limit: int = 10, topic: Optional[str] = None,
+                                  exclude_ids: Optional[Iterable[str]] = None) -> list: ...
+
+    def get_quiz_question_count(self) -> int: ...
+
+
+def load_backend(name: str = QUIZ_BACKEND) -> StorageBackend:
+    """Imports the backend module registered under ``name``."""
+    try:
+        module_name = BACKEND_MODULES[name]
+    except KeyError:
+        raise ValueError(f"Unknown QUIZ_BACKEND {name!r}; expected one of {', '.join(BACKEND_MODULES)}")
+    return importlib.import_module(module_name)
+
+
+def _timed(span_name: str, function: Callable) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with metrics.span(span_name, backend=QUIZ_BACKEND):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+backend = load_backend()
+
+initialize_firebase = backend.initialize_firebase
+is_duplicate_question = _timed("dedup_check", backend.is_duplicate_question)
+save_quiz_question = _timed("db_save", backend.save_quiz_question)
+save_quiz_questions = _timed("db_save_many", backend.save_quiz_questions)
+get_random_quiz_questions = _timed("db_sample", backend.get_random_quiz_questions)
+get_quiz_question_count = _timed("db_count", backend.get_quiz_question_count)
@@ -0,0 +1,209 @@
+"""End-to-end benchmarks for the quiz pipeline, run offline.
+
+Question generation runs against the local fake OpenAI endpoint, so no API
+key or network access is needed. Each benchmark reports p50/p95/p99 latency,
+throughput and peak traced memory; results are compared to a JSON baseline
+and the run fails when a benchmark is slower than the baseline by more than
+the tolerance.
+
+    python tests/benchmark.py                    # compare to tests/benchmark_baseline.json
+    python tests/benchmark.py --update-baseline  # record a new baseline
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(HERE), "QuizWhizAI")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+# Every generation must reach the endpoint, so the question cache is off
+os.environ["QUESTION_CACHE"] = "0"
+
+from fake_openai_server import FakeOpenAIServer  # noqa: E402
+
+BASELINE_PATH = os.path.join(HERE, "benchmark_baseline.json")
+PDF_PATH = os.path.join(APP_DIR, "gaddis_files", "Chapter05 Functions.pdf")
+TOPIC = "Chapter05 Functions"
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def measure(operation: Callable[[], object], repeat: int, workers: int = 1) -> Dict[str, float]:
+    """Times ``repeat`` calls of ``operation`` on ``workers`` threads, then traces one call's memory."""
+    def timed(_):
+        started = time.perf_counter()
+        operation()
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            latencies = list(pool.map(timed, range(repeat)))
+    else:
+        latencies = [timed(i) for i in range(repeat)]
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": round(_percentile(ordered, 0.50), 3),
+        "p95_ms": round(_percentile(ordered, 0.95), 3),
+        "p99_ms": round(_percentile(ordered, 0.99), 3),
+        "throughput_per_s": round(repeat / elapsed, 2),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def bench_generation(server: FakeOpenAIServer, api_key: str, repeat: int, workers: int) -> Dict[str, float]:
+    from get_quiz import get_quiz_from_topic
+
+    chunks = [f"Functions are named groups of statements. Example {i}. " * 20 for i in range(50)]
+    failures = []
+
+    def generate():
+        if get_quiz_from_topic(TOPIC, api_key, chunks, session_id="benchmark") is None:
+            failures.append(1)
+
+    requests_before = server.stats["requests"]
+    result = measure(generate, repeat, workers)
+    result["success_rate"] = round(1 - len(failures) / (repeat + 1), 3)
+    result["requests"] = server.stats["requests"] - requests_before
+    return result
+
+
+def bench_chunking(repeat: int) -> Dict[str, float]:
+    from create_context_from_PDF import iter_pdf_chunks
+
+    return measure(lambda: sum(1 for _ in iter_pdf_chunks(PDF_PATH)), repeat)
+
+
+def bench_snapshot_sampling(repeat: int, size: int = 20000) -> Dict[str, float]:
+    from firebase_snapshot import SnapshotQuestion, SnapshotStore
+
+    rng = random.Random(7)
+    topics = [f"Chapter{i:02d}" for i in range(1, 10)]
+    records = [
+        SnapshotQuestion({"question": f"Question {i}?", "options": ["A", "B", "C", "D"], "answer": "A",
+                          "explanation": f"Because {i}.", "topic": rng.choice(topics)})
+        for i in range(size)
+    ]
+    store = SnapshotStore(records)
+    seen = set()
+
+    def sample():
+        questions = store.sample(10, topic=rng.choice(topics), exclude_ids=seen)
+        seen.update(q["id"] for q in questions)
+        if len(seen) > 500:
+            seen.clear()
+
+    return measure(sample, repeat)
+
+
+def bench_pdf_export(repeat: int) -> Dict[str, float]:
+    from export_quiz_to_PDF import generate_quiz_pdf
+
+    quiz = [
+        {"question": f"What does function {i} return?\n    def f():\n        return {i}",
+         "options": [str(i), "None", "0", "Error"], "answer": str(i),
+         "explanation": f"The return statement sends {i} back to the caller.",
+         "user_answer": str(i), "is_correct": True}
+        for i in range(10)
+    ]
+    output_dir = tempfile.mkdtemp(prefix="quiz-bench-")
+
+    def export():
+        # A fresh title per call bypasses the in-memory PDF cache
+        title = f"Benchmark quiz {uuid.uuid4().hex[:8]}"
+        generate_quiz_pdf(quiz, title, os.path.join(output_dir, "quiz.pdf"))
+
+    return measure(export, repeat)
+
+
+def run(quick: bool) -> Dict[str, Dict[str, float]]:
+    scale = 0.2 if quick else 1.0
+
+    def n(count: int) -> int:
+        return max(5, int(count * scale))
+
+    results = {}
+    with FakeOpenAIServer(latency=0.02, jitter=0.01, seed=42) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        api_key = f"sk-bench-{uuid.uuid4().hex}"
+        results["generation_sequential"] = bench_generation(server, api_key, n(50), 1)
+        results["generation_concurrent"] = bench_generation(server, api_key, n(200), 8)
+    results["chunking"] = bench_chunking(n(10))
+    results["snapshot_sampling"] = bench_snapshot_sampling(n(2000))
+    results["pdf_export"] = bench_pdf_export(n(30))
+    return results
+
+
+def regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Benchmarks whose p95 latency rose or throughput fell by more than ``tolerance``."""
+    found = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if current["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            found.append(f"{name}: p95 {current['p95_ms']} ms vs baseline {reference['p95_ms']} ms")
+        if current["throughput_per_s"] < reference["throughput_per_s"] * (1 - tolerance):
+            found.append(f"{name}: throughput {current['throughput_per_s']}/s "
+                         f"vs baseline {reference['throughput_per_s']}/s")
+        if current.get("success_rate", 1) < reference.get("success_rate", 1):
+            found.append(f"{name}: success rate {current['success_rate']} "
+                         f"vs baseline {reference['success_rate']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the quiz pipeline offline.")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed relative slowdown before a benchmark counts as a regression")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations (noisier)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    found = regressions(results, baseline, args.tolerance)
+    if found:
+        print("❌ Regressions:\n  " + "\n  ".join(found))
+        sys.exit(1)
+    print("✅ No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The app modules import each other by bare module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "QuizWhizAI"))
+
+# Keep generated questions out of the app's persistent cache
+os.environ.setdefault("QUESTION_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="quiz-tests-"), "questions.db"))
@@ -0,0 +1,179 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Answers ``POST /v1/chat/completions`` with generated quiz questions after a
+configurable delay, and fails a configurable share of requests with a 500
+or 429 or with content that is not valid JSON. Another share can be
+returned as valid JSON wrapped in prose and a markdown fence. Point the SDK at it with
+``OPENAI_BASE_URL=server.base_url``.
+
+    python tests/fake_openai_server.py --port 8001 --latency 0.5 --error-rate 0.05
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIServer:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 malformed_rate: float = 0.0, fenced_rate: float = 0.0, host: str = "127.0.0.1",
+                 port: int = 0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.fenced_rate = fenced_rate
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _roll(self) -> str:
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return "error"
+        if roll < self.error_rate + self.malformed_rate:
+            return "malformed"
+        if roll < self.error_rate + self.malformed_rate + self.fenced_rate:
+            return "fenced"
+        return "ok"
+
+    def _question(self, topic: str) -> dict:
+        n = next(self._ids)
+        options = [f"Option {n}-{i}" for i in range(4)]
+        return {
+            "question": f"Fake question {n} about {topic}?",
+            "options": options,
+            "answer": options[n % 4],
+            "explanation": f"Option {n}-{n % 4} is correct because this is fake question {n}.",
+        }
+
+    def completion_content(self, messages: list) -> str:
+        prompt = messages[-1]["content"] if messages else ""
+        topic_match = re.search(r'about "([^"]+)"', prompt)
+        topic = topic_match.group(1) if topic_match else "Python"
+        batch_match = re.search(r"create (\d+) different", prompt)
+        if batch_match:
+            return json.dumps({"questions": [self._question(topic) for _ in range(int(batch_match.group(1)))]})
+        return json.dumps(self._question(topic), indent=4)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: dict, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                    return
+
+                delay = server.latency + server._random.uniform(0, server.jitter) if server.jitter else server.latency
+                time.sleep(delay)
+
+                outcome = server._roll()
+                with server._lock:
+                    server.stats["requests"] += 1
+                    server.stats[outcome] += 1
+                    request_number = server.stats["requests"]
+                if outcome == "error":
+                    if server._random.random() < 0.5:
+                        self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                                   {"Retry-After": "0"})
+                    else:
+                        self._send(500, {"error": {"message": "Internal error", "type": "server_error"}})
+                    return
+
+                content = server.completion_content(request.get("messages", []))
+                if outcome == "malformed":
+                    content = "Sure! Here is your question:\n" + content[: len(content) // 2]
+                elif outcome == "fenced":
+                    content = f"Here is your question:\n```json\n{content}\n```\nGood luck!"
+
+                prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4
+                completion_tokens = len(content) // 4
+                self._send(200, {
+                    "id": f"chatcmpl-fake-{request_number}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI chat completions endpoint.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--fenced-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.latency, args.jitter, args.error_rate, args.malformed_rate,
+                             args.fenced_rate, port=args.port)
+    print(f"Fake OpenAI endpoint at {server.base_url} (Ctrl+C to stop)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import build_question_bank
+from build_question_bank import MAX_UNPRODUCTIVE_REQUESTS, QuestionBankBuilder, RateLimiter
+
+QUESTION = {"question": "What does len() return?", "options": ["A count", "A list", "None", "0"],
+            "answer": "A count", "explanation": "len() counts items."}
+
+
+def test_topic_that_only_yields_duplicates_is_abandoned(tmp_path, monkeypatch):
+    monkeypatch.setattr(build_question_bank, "load_topic_contexts", lambda topics: {})
+    builder = QuestionBankBuilder(["Functions"], 50, "sk-test", None, str(tmp_path / "checkpoint.jsonl"),
+                                  batch_size=1, limiter=RateLimiter(60000))
+    calls = []
+
+    def generate(topic, n):
+        calls.append(topic)
+        return [dict(QUESTION)]
+
+    monkeypatch.setattr(builder, "_generate", generate)
+    builder.run(workers=2)
+
+    assert builder.accepted["Functions"] == 1
+    # One useful request, then a few that only repeat it (plus any already in flight)
+    assert len(calls) <= 1 + MAX_UNPRODUCTIVE_REQUESTS + 1
@@ -0,0 +1,50 @@
+from create_context_from_PDF import (TextChunk, _read_chunk_cache, _write_chunk_cache, estimate_tokens,
+                                     iter_chunks)
+
+
+def _paragraph(word: str, tokens: int) -> str:
+    # estimate_tokens counts four characters per token
+    return " ".join([word] * tokens)[:tokens * 4 - 3] + "."
+
+
+def test_paragraphs_are_packed_without_being_cut():
+    paragraphs = [_paragraph(w, 40) for w in ("alpha", "bravo", "charlie", "delta", "echo")]
+    chunks = list(iter_chunks(((1, "text", p) for p in paragraphs), max_tokens=100, overlap_tokens=0))
+    assert all(estimate_tokens(c.text) <= 100 for c in chunks)
+    assert [c.text.split("\n\n") for c in chunks] == [paragraphs[0:2], paragraphs[2:4], paragraphs[4:5]]
+
+
+def test_trailing_block_is_repeated_as_overlap():
+    paragraphs = [_paragraph("long", 60), _paragraph("short", 20), _paragraph("next", 60)]
+    chunks = list(iter_chunks(((1, "text", p) for p in paragraphs), max_tokens=100, overlap_tokens=30))
+    assert chunks[0].text.split("\n\n") == paragraphs[0:2]
+    assert chunks[1].text.split("\n\n") == paragraphs[1:3]
+
+
+def test_heading_starts_a_new_chunk_with_its_section():
+    blocks = [
+        (1, "heading", "Introduction"),
+        (1, "text", _paragraph("intro", 40)),
+        (2, "heading", "Defining Functions"),
+        (2, "text", _paragraph("def", 20)),
+        (3, "heading", "Defining Functions (cont'd.)"),
+        (3, "text", _paragraph("more", 20)),
+    ]
+    chunks = list(iter_chunks(blocks, max_tokens=100, overlap_tokens=0))
+    assert [(c.page, c.section) for c in chunks] == [(1, "Introduction"), (2, "Defining Functions")]
+    # The continued heading is not repeated inside the section
+    assert chunks[1].text.count("Defining Functions") == 1
+
+
+def test_long_code_listing_is_split_on_lines():
+    code = "\n".join(f"    total = total + value_{i}" for i in range(40))
+    chunks = list(iter_chunks([(1, "code", code)], max_tokens=50, overlap_tokens=0))
+    assert len(chunks) > 1
+    assert "\n".join(c.text for c in chunks) == code
+
+
+def test_chunk_cache_round_trip(tmp_path):
+    chunks = [TextChunk("First chunk with ünïcode", 1, "Intro"), TextChunk("Second", 3, "")]
+    path = str(tmp_path / "chunks.bin")
+    assert _write_chunk_cache(path, iter(chunks)) == 2
+    assert _read_chunk_cache(path) == chunks
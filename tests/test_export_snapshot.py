@@ -0,0 +1,16 @@
+import datetime
+
+from export_snapshot import _export_started, _final_watermark
+
+
+def test_watermark_is_capped_at_export_start():
+    started_at = "2026-01-01T12:00:00+00:00"
+    # A document written mid-export pushed the largest updated_at past the start
+    assert _final_watermark("2026-01-01T12:05:00+00:00", started_at) == started_at
+    assert _final_watermark("2026-01-01T11:00:00+00:00", started_at) == "2026-01-01T11:00:00+00:00"
+    assert _final_watermark(None, started_at) is None
+
+
+def test_export_start_allows_for_clock_skew():
+    started_at = datetime.datetime.fromisoformat(_export_started())
+    assert started_at < datetime.datetime.now(datetime.timezone.utc)
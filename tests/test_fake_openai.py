@@ -0,0 +1,90 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+import get_quiz
+import openai_client
+from get_quiz import REPAIR_MAX_RETRIES, get_quiz_from_topic, get_quizzes_from_topic
+from tests.fake_openai_server import FakeOpenAIServer
+
+TOPIC = "Chapter05 Functions"
+CHUNKS = ["A function is a group of statements that exist within a program " * 10]
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Starts a fake endpoint and returns (server, api_key) for a client pointed at it."""
+    servers = []
+
+    def start(**options):
+        server = FakeOpenAIServer(seed=1, **options).start()
+        servers.append(server)
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        # Clients are cached per key, so a fresh key gets a client for this server
+        return server, f"sk-test-{uuid.uuid4().hex}"
+
+    monkeypatch.setattr(openai_client, "_BACKOFF_BASE", 0.01)
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def test_question_from_fake_endpoint(fake_openai):
+    server, api_key = fake_openai()
+    question = get_quiz_from_topic(TOPIC, api_key, CHUNKS)
+    assert question["answer"] in question["options"]
+    assert TOPIC in question["question"]
+    assert server.stats["requests"] == 1
+
+
+def test_batch_from_fake_endpoint(fake_openai):
+    _, api_key = fake_openai()
+    questions = get_quizzes_from_topic(TOPIC, api_key, CHUNKS, n=4)
+    assert len(questions) == 4
+    assert len({q["question"] for q in questions}) == 4
+
+
+def test_server_errors_are_retried(fake_openai):
+    server, api_key = fake_openai(error_rate=1.0)
+    assert get_quiz_from_topic(TOPIC, api_key, CHUNKS) is None
+    assert server.stats["requests"] == openai_client.OPENAI_MAX_RETRIES + 1
+
+
+def test_malformed_json_is_rejected_after_repair_retry(fake_openai):
+    server, api_key = fake_openai(malformed_rate=1.0)
+    assert get_quiz_from_topic(TOPIC, api_key, CHUNKS) is None
+    assert server.stats["requests"] == 1 + REPAIR_MAX_RETRIES
+
+
+def test_fenced_json_is_repaired_without_retry(fake_openai):
+    server, api_key = fake_openai(fenced_rate=1.0)
+    question = get_quiz_from_topic(TOPIC, api_key, CHUNKS)
+    assert question["answer"] in question["options"]
+    assert server.stats["requests"] == 1
+
+
+def test_cached_questions_are_served_once_per_session(fake_openai):
+    from get_quiz import get_quizzes_for_session
+
+    server, api_key = fake_openai()
+    topic = f"Cache topic {uuid.uuid4().hex}"
+    first = get_quizzes_for_session(topic, api_key, CHUNKS, n=3, session_id="alice")
+    assert server.stats["requests"] == 1
+
+    # Another session is served the pooled questions without a request
+    second = get_quizzes_for_session(topic, api_key, CHUNKS, n=3, session_id="bob")
+    assert server.stats["requests"] == 1
+    assert {q["question"] for q in second} == {q["question"] for q in first}
+
+    # A session that has seen the pool gets fresh questions
+    third = get_quizzes_for_session(topic, api_key, CHUNKS, n=3, session_id="alice")
+    assert server.stats["requests"] == 2
+    assert not {q["question"] for q in third} & {q["question"] for q in first}
+
+
+def test_batch_with_empty_content_returns_no_questions(monkeypatch):
+    # A refusal comes back with ``content`` set to None
+    reply = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=None))])
+    monkeypatch.setattr(get_quiz, "create_chat_completion", lambda *args, **kwargs: reply)
+    assert get_quizzes_from_topic(TOPIC, "sk-test", CHUNKS, n=2) == []
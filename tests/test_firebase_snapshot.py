@@ -0,0 +1,109 @@
+import json
+import time
+
+import pytest
+
+import firebase_snapshot
+from firebase_snapshot import SnapshotQuestion, SnapshotStore, SnapshotWriter, iter_snapshot_records
+
+
+def _record(i: int, topic: str) -> dict:
+    return {"question": f"Question {i}?", "options": ["a", "b", "c", "d"], "answer": "a",
+            "explanation": f"Because {i}.", "topic": topic}
+
+
+@pytest.fixture
+def store():
+    records = [_record(i, "Functions" if i % 2 else "Lists") for i in range(20)]
+    return SnapshotStore([SnapshotQuestion(r) for r in records])
+
+
+def test_sample_stays_within_topic_without_repeats(store):
+    questions = store.sample(5, topic="Functions")
+    assert len(questions) == 5
+    assert {q["topic"] for q in questions} == {"Functions"}
+    assert len({q["id"] for q in questions}) == 5
+
+
+def test_sample_skips_excluded_ids(store):
+    seen = set()
+    for _ in range(3):
+        questions = store.sample(3, topic="Lists", exclude_ids=seen)
+        assert not {q["id"] for q in questions} & seen
+        seen.update(q["id"] for q in questions)
+    # Only one Lists question is left, which the filtering fallback must find
+    assert len(store.sample(3, topic="Lists", exclude_ids=seen)) == 1
+    assert store.sample(3, topic="Unknown") == []
+
+
+def test_records_share_interned_answer_and_topic(store):
+    first, second = store.records[1], store.records[3]
+    assert first.topic is second.topic
+    assert first.answer is first.options[0]
+
+
+@pytest.mark.parametrize("name", ["snapshot.json", "snapshot.jsonl"])
+def test_writer_output_streams_back(tmp_path, name):
+    path = str(tmp_path / name)
+    records = [_record(i, "Functions") for i in range(50)]
+    writer = SnapshotWriter(path)
+    for record in records:
+        writer.write(record)
+    writer.close()
+
+    assert list(iter_snapshot_records(path, chunk_size=64)) == records
+    if name.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            assert json.load(f) == records
+
+
+def _write_snapshot(path: str, count: int) -> None:
+    writer = SnapshotWriter(path)
+    for i in range(count):
+        writer.write(_record(i, "Functions"))
+    writer.close()
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def snapshot_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "questions_snapshot.json")
+    monkeypatch.setattr(firebase_snapshot, "_SNAPSHOT_PATH", path)
+    monkeypatch.setattr(firebase_snapshot, "SNAPSHOT_CHECK_INTERVAL", 0.0)
+    monkeypatch.setattr(firebase_snapshot, "_STORE", None)
+    monkeypatch.setattr(firebase_snapshot, "_STORE_STAMP", None)
+    return path
+
+
+def test_changed_snapshot_is_swapped_in(snapshot_file):
+    _write_snapshot(snapshot_file, 3)
+    old = firebase_snapshot._ensure_loaded()
+    assert len(old) == 3
+
+    _write_snapshot(snapshot_file, 5)
+    # The caller that noticed the change is still served the old store
+    assert firebase_snapshot._ensure_loaded() is old
+    assert _wait_for(lambda: len(firebase_snapshot._ensure_loaded()) == 5)
+    assert len(old) == 3
+
+
+def test_unreadable_snapshot_keeps_the_previous_store(snapshot_file):
+    _write_snapshot(snapshot_file, 3)
+    old = firebase_snapshot._ensure_loaded()
+    with open(snapshot_file, "w", encoding="utf-8") as f:
+        f.write('[{"question": "Half written')
+    firebase_snapshot.reload_snapshot(wait=True)
+    assert firebase_snapshot._ensure_loaded() is old
+
+
+def test_duplicate_check_is_an_exact_hash_lookup(store):
+    assert store.is_duplicate(_record(4, "Lists"))
+    assert not store.is_duplicate({**_record(4, "Lists"), "question": "Question 4 reworded?"})
@@ -0,0 +1,74 @@
+import json
+import sys
+
+import pytest
+
+import near_duplicates
+from near_duplicates import (NearDuplicateIndex, _band_layout, dedup_questions, estimated_similarity,
+                             minhash_signature)
+
+QUESTION = {"question": "Which built-in function returns the number of items in a list, tuple, "
+                        "string or dictionary in Python programs?", "answer": "len()"}
+REWORDED = {"question": "Which built-in function returns the number of items in a list, tuple, "
+                        "string or dictionary when writing Python programs?", "answer": "len()"}
+UNRELATED = {"question": "What keyword defines a function in Python?", "answer": "def"}
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.7, 0.8, 0.9])
+def test_band_layout_finds_pairs_at_the_threshold(threshold):
+    bands, rows = _band_layout(threshold, 128)
+    assert bands * rows <= 128
+    assert 1 - (1 - threshold ** rows) ** bands >= 0.95
+    # The S-curve midpoint sits below the confirm threshold
+    assert (1 / bands) ** (1 / rows) < threshold
+
+
+def test_index_finds_pair_just_above_threshold():
+    similarity = estimated_similarity(minhash_signature(QUESTION), minhash_signature(REWORDED))
+    assert 0.8 <= similarity < 0.85
+
+    index = NearDuplicateIndex(0.8)
+    index.add("original", QUESTION)
+    assert [key for key, _ in index.query(REWORDED)] == ["original"]
+    assert not index.is_near_duplicate(UNRELATED)
+
+
+def test_dedup_keeps_first_of_each_group():
+    kept, dropped = dedup_questions([QUESTION, UNRELATED, REWORDED, dict(QUESTION)], 0.8)
+    assert kept == [QUESTION, UNRELATED]
+    assert dropped == [REWORDED, QUESTION]
+
+
+def test_main_streams_jsonl_snapshot(tmp_path, monkeypatch, capsys):
+    snapshot = tmp_path / "questions.jsonl"
+    output = tmp_path / "deduplicated.jsonl"
+    snapshot.write_text("".join(json.dumps(q) + "\n" for q in [QUESTION, UNRELATED, REWORDED]), encoding="utf-8")
+
+    monkeypatch.setattr(sys, "argv", ["near_duplicates.py", str(snapshot), "--output", str(output)])
+    near_duplicates.main()
+
+    written = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert written == [QUESTION, UNRELATED]
+    assert "Kept 2 of 3 questions (1 near-duplicates)" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("first, second", [
+    ("What is the value of x after this code runs?\nx = 10\nx //= 3",
+     "What is the value of x after this code runs?\nx = 10\nx %= 3"),
+    ("What does print(2 + 3) display?", "What does print(2 * 3) display?"),
+])
+def test_questions_differing_in_an_operator_are_not_duplicates(first, second):
+    options = ["1", "3", "5", "6"]
+    index = NearDuplicateIndex(0.8)
+    # Same options and answer, so only the operator tells them apart
+    index.add("first", {"question": first, "options": options, "answer": "3"})
+    assert not index.is_near_duplicate({"question": second, "options": options, "answer": "3"})
+
+
+def test_options_take_part_in_the_signature():
+    question = {"question": "Which of these is a mutable type?", "options": ["list", "tuple", "str", "int"],
+                "answer": "list"}
+    shuffled = {**question, "options": ["int", "str", "tuple", "list"]}
+    other = {**question, "options": ["list", "frozenset", "bytes", "range"]}
+    assert minhash_signature(shuffled) == minhash_signature(question)
+    assert minhash_signature(other) != minhash_signature(question)
@@ -0,0 +1,38 @@
+import pytest
+
+from question_cache import QuestionCache
+
+CHUNKS = ["Functions group statements.", "A function is called by name."]
+
+
+def _question(i: int) -> dict:
+    return {"question": f"Question {i}?", "options": ["a", "b", "c", "d"], "answer": "a",
+            "explanation": f"Because {i}."}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return QuestionCache(str(tmp_path / "questions.db"), pool_size=3)
+
+
+def test_questions_from_changed_material_are_not_served(cache):
+    cache.add("model", "Functions", 1, CHUNKS, [_question(1)])
+    assert cache.take("model", "Functions", 1, CHUNKS + ["A new slide."], "alice", 5) == []
+    assert cache.take("model", "Functions", 1, CHUNKS, "alice", 5) == [_question(1)]
+
+
+def test_pool_is_capped_per_topic_across_batches(cache):
+    # Batches built from different chunks of the same material share one pool
+    for i in range(5):
+        cache.add("model", "Functions", 1, CHUNKS, [_question(i)])
+    served = cache.take("model", "Functions", 1, CHUNKS, "alice", 10)
+    assert sorted(q["question"] for q in served) == ["Question 2?", "Question 3?", "Question 4?"]
+
+
+def test_session_is_not_served_a_question_twice(cache):
+    cache.add("model", "Functions", 1, CHUNKS, [_question(1), _question(2)])
+    first = cache.take("model", "Functions", 1, CHUNKS, "alice", 1)
+    second = cache.take("model", "Functions", 1, CHUNKS, "alice", 5)
+    assert len(first) == 1 and len(second) == 1
+    assert first != second
+    assert len(cache.take("model", "Functions", 1, CHUNKS, "bob", 5)) == 2
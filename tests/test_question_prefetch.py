@@ -0,0 +1,88 @@
+import threading
+
+from question_prefetch import QuestionPrefetcher
+
+
+class FakeGenerator:
+    """Returns numbered questions; the first multi-question batch is ``short_by`` questions short."""
+
+    def __init__(self, short_by: int = 0):
+        self.short_by = short_by
+        self.requested = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, n: int):
+        with self._lock:
+            self.requested.append(n)
+            start = self._count
+            self._count += n
+            short_by = 0
+            if n > 1:
+                short_by, self.short_by = self.short_by, 0
+        return [{"question": f"Q{i}"} for i in range(start, start + n - short_by)]
+
+
+def _drain(prefetcher: QuestionPrefetcher):
+    questions = []
+    while True:
+        question = prefetcher.get(timeout=5)
+        if question is None:
+            return questions
+        questions.append(question)
+
+
+def test_never_requests_more_than_the_budget():
+    generate = FakeGenerator()
+    prefetcher = QuestionPrefetcher("Functions", generate, budget=7, depth=4, batch_size=3)
+    questions = _drain(prefetcher)
+    assert [q["question"] for q in questions] == [f"Q{i}" for i in range(7)]
+    assert sum(generate.requested) == 7
+    assert max(generate.requested) <= 3
+
+
+def test_undelivered_questions_are_refunded_to_the_budget():
+    generate = FakeGenerator(short_by=1)
+    prefetcher = QuestionPrefetcher("Functions", generate, budget=6, depth=3, batch_size=3)
+    questions = _drain(prefetcher)
+    # The question missing from the first batch is requested again
+    assert len(questions) == 6
+    assert sum(generate.requested) == 7
+
+
+def test_failed_generation_is_refunded():
+    calls = []
+
+    def generate(n):
+        calls.append(n)
+        if len(calls) == 1:
+            raise RuntimeError("rate limited")
+        return [{"question": f"Q{len(calls)}-{i}"} for i in range(n)]
+
+    prefetcher = QuestionPrefetcher("Functions", generate, budget=2, depth=2, batch_size=2)
+    assert prefetcher.get(timeout=5) is None
+    assert len(_drain(prefetcher)) == 2
+
+
+def test_close_stops_requesting_and_serving():
+    release = threading.Event()
+    generate = FakeGenerator()
+
+    def slow(n):
+        release.wait(5)
+        return generate(n)
+
+    prefetcher = QuestionPrefetcher("Functions", slow, budget=10, depth=2, batch_size=2)
+    prefetcher.close()
+    release.set()
+    assert prefetcher.get(timeout=1) is None
+    assert sum(generate.requested) <= 2
+
+
+def test_first_question_is_requested_alone():
+    generate = FakeGenerator()
+    prefetcher = QuestionPrefetcher("Functions", generate, budget=10, depth=5, batch_size=5)
+    assert prefetcher.get(timeout=5) == {"question": "Q0"}
+    # The rest of the buffer was requested as one batch next to it
+    assert generate.requested[:2] == [1, 4]
+    assert len(_drain(prefetcher)) == 9
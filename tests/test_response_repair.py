@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from response_repair import extract_json, match_answer, repair_question
+
+OPTIONS = ["print()", "input()", "len()", "range()"]
+
+
+def test_extract_json_from_fenced_reply_with_prose():
+    reply = 'Sure!\n```json\n{"question": "Q?", "options": ["a"]}\n```\nEnjoy.'
+    data, repairs = extract_json(reply)
+    assert data == {"question": "Q?", "options": ["a"]}
+    assert repairs == ["fences"]
+
+
+def test_extract_json_from_prose_without_fences():
+    data, repairs = extract_json('Here you go: {"answer": "x"} Hope that helps.')
+    assert data == {"answer": "x"}
+    assert repairs == ["extracted_json"]
+
+
+def test_extract_json_fails_on_truncated_reply():
+    with pytest.raises(json.JSONDecodeError):
+        extract_json('Here you go: {"question": "Q?", "options": [')
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("len()", "len()"),
+    ("  LEN() ", "len()"),
+    ("C", "len()"),
+    ("C) len()", "len()"),
+    ("len ()", "len()"),
+    ("open()", None),
+])
+def test_match_answer(answer, expected):
+    assert match_answer(answer, OPTIONS) == expected
+
+
+@pytest.mark.parametrize("answer, options, expected", [
+    ("[1, 2, 3]", ["[1, 2, 4]", "[1, 2]", "[3, 2, 1]", "Error"], None),
+    ("x != 1", ["x == 1", "x = 1", "x is 1", "not x"], None),
+    ("print('hi')", ['print("hi")', "print(hi)", "echo hi", "None"], 'print("hi")'),
+    ("[1,2,3]", ["[1, 2, 3]", "[1, 2, 4]", "[1, 2]", "Error"], "[1, 2, 3]"),
+])
+def test_match_answer_only_forgives_whitespace_case_and_quotes(answer, options, expected):
+    assert match_answer(answer, options) == expected
+
+
+def test_repair_question_maps_answer_onto_option():
+    data, repairs = repair_question({"options": OPTIONS, "answer": "b"})
+    assert data["answer"] == "input()"
+    assert repairs == ["answer_matched"]
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+import sqlite_backend
+from near_duplicates import NearDuplicateIndex
+
+
+def _question(i: int, topic: str = "Functions") -> dict:
+    return {"question": f"What does function number {i} of chapter {topic} return?",
+            "options": [str(i), "None", "0", "Error"], "answer": str(i), "explanation": f"It returns {i}."}
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_backend, "SQLITE_PATH", str(tmp_path / "questions.db"))
+    monkeypatch.setattr(sqlite_backend, "_NEAR_DUPLICATES", NearDuplicateIndex(0.8))
+
+
+def test_saving_twice_is_idempotent():
+    questions = [_question(i) for i in range(3)]
+    first = sqlite_backend.save_quiz_questions("Functions", questions)
+    second = sqlite_backend.save_quiz_questions("Functions", questions)
+    assert first == second
+    assert sqlite_backend.get_quiz_question_count() == 3
+    assert sqlite_backend.is_duplicate_question(questions[0])
+
+
+def test_malformed_questions_are_skipped():
+    saved = sqlite_backend.save_quiz_questions("Functions", [_question(1), {"question": "No options?"}])
+    assert len(saved) == 1
+    assert sqlite_backend.get_quiz_question_count() == 1
+
+
+def test_sampling_filters_topic_and_excluded_ids():
+    sqlite_backend.save_quiz_questions("Functions", [_question(i) for i in range(10)])
+    sqlite_backend.save_quiz_questions("Lists", [_question(i, "Lists") for i in range(10)])
+
+    first = sqlite_backend.get_random_quiz_questions(4, topic="Lists")
+    assert len(first) == 4
+    assert {q["topic"] for q in first} == {"Lists"}
+
+    seen = {q["id"] for q in first}
+    second = sqlite_backend.get_random_quiz_questions(4, topic="Lists", exclude_ids=seen)
+    assert len(second) == 4
+    assert not {q["id"] for q in second} & seen
+
+
+def test_sampling_wraps_around_past_the_last_random_key(monkeypatch):
+    sqlite_backend.save_quiz_questions("Functions", [_question(i) for i in range(5)])
+    # A pivot above every random_key must wrap to the start of the index
+    monkeypatch.setattr(sqlite_backend.random, "random", lambda: 1.0)
+    questions = sqlite_backend.get_random_quiz_questions(5)
+    assert len({q["id"] for q in questions}) == 5
+
+
+def test_threads_share_one_connection():
+    connections = []
+
+    def use(i):
+        with sqlite_backend._connection() as conn:
+            connections.append(conn)
+        sqlite_backend.save_quiz_questions("Functions", [_question(i)])
+
+    threads = [threading.Thread(target=use, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(conn) for conn in connections}) == 1
+    assert sqlite_backend.get_quiz_question_count() == 4
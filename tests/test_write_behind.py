@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from firebase_backend import WriteBehindQueue
+
+
+class FakeFirestore:
+    """Records committed batches; raises for batches containing a rejected id
+    and for the first ``transient_failures`` commits."""
+
+    def __init__(self, rejected=(), transient_failures=0):
+        self.rejected = set(rejected)
+        self.transient_failures = transient_failures
+        self.committed = []
+
+    def commit(self, batch):
+        if self.transient_failures:
+            self.transient_failures -= 1
+            raise ConnectionError("unavailable")
+        if any(doc_id in self.rejected for doc_id, _ in batch):
+            raise ValueError("document rejected")
+        self.committed.extend(doc_id for doc_id, _ in batch)
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(store, batch_size=4):
+        queue = WriteBehindQueue(str(tmp_path / "spool.jsonl"), batch_size, interval=0.001, max_attempts=2,
+                                 dead_letter_path=str(tmp_path / "dead.jsonl"))
+        queue._commit = store.commit
+        return queue
+    return make
+
+
+def _lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_spooled_saves_are_replayed_on_start(tmp_path, make_queue):
+    spool = tmp_path / "spool.jsonl"
+    spool.write_text('["a", {"question": "A?"}]\n["b", {"question": "B?"}]\n["c", {"quest', encoding="utf-8")
+    store = FakeFirestore()
+    queue = make_queue(store)
+    queue.start()
+    assert queue.flush(5)
+    assert store.committed == ["a", "b"]
+    assert _lines(spool) == []
+
+
+def test_transient_failures_are_retried(make_queue):
+    store = FakeFirestore(transient_failures=1)
+    queue = make_queue(store)
+    for doc_id in "abc":
+        queue.put(doc_id, {})
+    assert queue.flush(5)
+    assert store.committed == ["a", "b", "c"]
+
+
+def test_rejected_document_is_dead_lettered(tmp_path, make_queue):
+    store = FakeFirestore(rejected={"c"})
+    queue = make_queue(store)
+    for doc_id in "abcdefg":
+        queue.put(doc_id, {"question": doc_id})
+    assert queue.flush(5)
+    assert sorted(store.committed) == ["a", "b", "d", "e", "f", "g"]
+    assert _lines(tmp_path / "dead.jsonl") == [["c", {"question": "c"}]]
+    assert _lines(tmp_path / "spool.jsonl") == []